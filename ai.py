@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+
+# File: ai.py
+# Description: Automatic player based on the search of block placements.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import collections
+import time
+
+import constants
+import engine
+
+# Weights of board features (aggregate height, removed lines, holes and bumpiness)
+WEIGHT_HEIGHT = -0.510066
+WEIGHT_LINES  =  0.760666
+WEIGHT_HOLES  = -0.35663
+WEIGHT_BUMPS  = -0.184483
+
+class Search(object):
+    """
+    State of the search of the active block placement (see AutoPlayer.get_plan).
+    """
+
+    def __init__(self,blk,width,placements,kind,rotations):
+        """
+        Initialize the search.
+
+        Parameters:
+            - blk - the searched block (the search is valid only for its current state)
+            - width - number of cells in one line
+            - placements - list of (score,lines,new_rows,path) tuples of placements evaluated
+                           without the next block
+            - kind - type of the next block (None means not to try its placements)
+            - rotations - rotation states of the next block
+        """
+        self.block = blk
+        self.state = blk.get_state()
+        self.width = width
+        self.placements = placements
+        self.kind = kind
+        self.rotations = rotations
+        # The best placement so far (the first one is selected from placements with the same score)
+        self.best = None
+        if placements:
+            self.best = max(range(len(placements)),key=lambda i: (placements[i][0],-i))
+        # Placements tried with the next block (the best placements go first), the index of the
+        # next tried placement and the best score with the next block
+        self.order = []
+        if kind is not None:
+            self.order = sorted(range(len(placements)),key=lambda i: (-placements[i][0],i))
+        self.pos = 0
+        self.best_score = None
+
+    def is_done(self):
+        """
+        Returns true if all placements were tried.
+        """
+        return self.pos == len(self.order)
+
+class AutoPlayer(object):
+    """
+    The automatic player. When the new block appears, the player finds all
+    reachable placements (rotation and column) of the active block, tries
+    all placements of the next block on each resulting board and selects the
+    placement with the best evaluation of the board. After that, it returns
+    actions which move the block to the selected placement and drop it.
+
+    The search can have the time budget (e.g., the rest of the frame). All placements
+    are evaluated without the next block first, placements of the next block are tried
+    from the best placement while the budget lasts. The unfinished search is continued
+    by the next call, the best placement found so far is selected by the final call.
+    The search without the budget is deterministic.
+
+    Boards are stored as lists of line bit masks (bit X is the cell in the column X).
+    Evaluations of boards are kept in the cache, because the same boards are reached
+    by different placements.
+    """
+
+    def __init__(self,lookahead=True,cache_size=constants.AI_CACHE_SIZE):
+        """
+        Initialize the player.
+
+        Parameters:
+            - lookahead - try placements of the next block
+            - cache_size - maximal number of evaluated boards in the cache
+        """
+        self.lookahead = lookahead
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        # The block we have planned for, remaining actions and the unfinished search
+        self.block = None
+        self.plan = []
+        self.search = None
+        # Statistics - number of evaluated placements, the time of the search, number of
+        # searches finished without all placements of the next block and calls over the budget
+        self.evaluated = 0
+        self.search_time = 0.0
+        self.cut = 0
+        self.over_budget = 0
+        # Block masks for each rotation state, see get_masks
+        self.masks = {}
+
+    def placements_per_sec(self):
+        """
+        Returns the number of evaluated placements per second.
+        """
+        return self.evaluated / self.search_time if self.search_time else 0.0
+
+    def get_action(self,eng):
+        """
+        Returns the next action for the game. The search is done when the new
+        block appears, the block is dropped after reaching the placement.
+
+        Parameters:
+            - eng - the engine.Engine object with the game
+        """
+        if eng.active_block is not self.block:
+            self.block = eng.active_block
+            self.plan = self.get_plan(eng)
+        if self.plan:
+            return self.plan.pop(0)
+        return engine.ACTION_DOWN
+
+    def is_searching(self):
+        """
+        Returns true if the search of the placement is not finished (see get_moves).
+        """
+        return self.search is not None
+
+    def get_moves(self,eng,budget=None,final=True):
+        """
+        Returns all actions needed to reach the selected placement of the new block
+        and to drop it. The empty list is returned if the block was already planned or
+        if the search was not finished in the budget (it is continued by the next call).
+
+        Parameters:
+            - eng - the engine.Engine object with the game
+            - budget - maximal time of the search in ms (None means no limit)
+            - final - the placement has to be selected by this call (the best placement
+                      found so far is used if the search was not finished)
+        """
+        if eng.active_block is self.block and self.search is None:
+            return []
+        self.block = eng.active_block
+        self.plan = []
+        return self.get_plan(eng,budget,final)
+
+    def get_plan(self,eng,budget=None,final=True):
+        """
+        Find the best placement of the active block and returns the list of actions
+        (rotations followed by moves to the left or right and the drop) to reach it.
+        Placements without the next block are always evaluated, placements of the next
+        block are tried till the budget is spent (one of them is tried by each call, so the
+        search always finishes). The unfinished search is continued by the next call (it
+        is started again if the block was moved) and the empty list is returned if the
+        call is not final.
+
+        Parameters:
+            - eng - the engine.Engine object with the game
+            - budget - maximal time of the search in ms (None means no limit)
+            - final - the placement has to be selected by this call
+        """
+        start = time.perf_counter()
+        deadline = start + budget/1000.0 if budget is not None else None
+        blk = eng.active_block
+        search = self.search
+        if search is None or search.block is not blk or search.state != blk.get_state():
+            search = self.search = self.start_search(eng)
+        # Try placements of the next block, the first one without the deadline
+        tried = 0
+        while not search.is_done():
+            i = search.order[search.pos]
+            plain,lines,new_rows,path = search.placements[i]
+            score = self.evaluate_next(new_rows,search.width,search.kind,search.rotations,deadline if tried else None)
+            tried += 1
+            if score is None:
+                break
+            score += WEIGHT_LINES*lines
+            if search.best_score is None or score > search.best_score or (score == search.best_score and i < search.best):
+                search.best_score = score
+                search.best = i
+            search.pos += 1
+        elapsed = time.perf_counter() - start
+        if budget is not None and elapsed*1000.0 > budget:
+            self.over_budget += 1
+        self.search_time += elapsed
+        if not search.is_done():
+            if not final:
+                return []
+            self.cut += 1
+        self.search = None
+        if search.best is None:
+            return [engine.ACTION_DROP]
+        return search.placements[search.best][3] + [engine.ACTION_DROP]
+
+    def start_search(self,eng):
+        """
+        Evaluate all placements of the active block without the next block and return
+        the new Search object.
+
+        Parameters:
+            - eng - the engine.Engine object with the game
+        """
+        board = eng.board
+        rows = self.get_rows(board.cells,board.width,board.height)
+        blk = eng.active_block
+        x = (blk.x - eng.board_x)//constants.BWIDTH
+        y = (blk.y - eng.board_y)//constants.BHEIGHT
+        placements = []
+        for value,path in self.get_placements(rows,board.width,blk.rotations,blk.rotation,x,y):
+            lines,new_rows = value
+            placements.append((WEIGHT_LINES*lines + self.evaluate(new_rows,board.width),lines,new_rows,path))
+        kind = eng.next_kind if self.lookahead else None
+        rotations = eng.block_rotations[kind] if kind is not None else None
+        return Search(blk,board.width,placements,kind,rotations)
+
+    def get_rows(self,cells,width,height):
+        """
+        Convert the board cells to the list of line bit masks.
+
+        Parameters:
+            - cells - cells of the board.Board
+            - width - number of cells in one line
+            - height - number of lines
+        """
+        rows = []
+        for y in range(height):
+            mask = 0
+            for x,value in enumerate(cells[y*width:(y+1)*width]):
+                if value:
+                    mask |= 1 << x
+            rows.append(mask)
+        return rows
+
+    def get_tops(self,rows,width):
+        """
+        Returns the list with the first occupied line of each column (the number of
+        lines for the empty column).
+
+        Parameters:
+            - rows - list of line masks
+            - width - number of cells in one line
+        """
+        tops = [len(rows)]*width
+        full = (1 << width) - 1
+        seen = 0
+        for y,row in enumerate(rows):
+            new = row & ~seen
+            x = 0
+            while new:
+                if new & 1:
+                    tops[x] = y
+                new >>= 1
+                x += 1
+            seen |= row
+            if seen == full:
+                break
+        return tops
+
+    def get_masks(self,offsets):
+        """
+        Returns the tuple (min_x,max_x,masks,bottoms) of the rotation state. The masks
+        is the list of (Y,mask) tuples where the mask is the bit mask of shape blocks on
+        the Y offset shifted to start on the min_x offset. The bottoms is the list of
+        (X,Y) offsets of the lowest shape block in each column (X starts on the min_x offset).
+
+        Parameters:
+            - offsets - (X,Y) offsets of the rotation state
+        """
+        res = self.masks.get(offsets)
+        if res is None:
+            min_x = min([dx for dx,dy in offsets])
+            max_x = max([dx for dx,dy in offsets])
+            masks = {}
+            bottoms = {}
+            for dx,dy in offsets:
+                masks[dy] = masks.get(dy,0) | (1 << (dx - min_x))
+                bottoms[dx - min_x] = max(dy,bottoms.get(dx - min_x,dy))
+            res = (min_x,max_x,sorted(masks.items()),sorted(bottoms.items()))
+            self.masks[offsets] = res
+        return res
+
+    def fits(self,rows,width,offsets,x,y):
+        """
+        Returns true if the block fits on the board.
+
+        Parameters:
+            - rows - list of line masks
+            - width - number of cells in one line
+            - offsets - (X,Y) offsets of the rotation state
+            - x,y - position of the block
+        """
+        min_x,max_x,masks,bottoms = self.get_masks(offsets)
+        if x + min_x < 0 or x + max_x >= width:
+            return False
+        for dy,mask in masks:
+            line = y + dy
+            if line < 0 or line >= len(rows) or rows[line] & (mask << (x + min_x)):
+                return False
+        return True
+
+    def get_placements(self,rows,width,rotations,rotation,x,y):
+        """
+        Generate all reachable placements of the block. The block is rotated on the
+        start position, moved to the left or right and dropped down. The block must
+        be able to move down after each action (otherwise it would be locked). Yields
+        ((lines,new_rows),path) tuples where the lines is the number of removed lines,
+        new_rows are lines of the new board and the path is the list of actions.
+
+        Parameters:
+            - rows - list of line masks
+            - width - number of cells in one line
+            - rotations - rotation states of the block
+            - rotation - current rotation state
+            - x,y - position of the block
+        """
+        tops = self.get_tops(rows,width)
+        path = []
+        for rot_cnt in range(len(rotations)):
+            offsets = rotations[(rotation + rot_cnt) % len(rotations)]
+            if not (self.fits(rows,width,offsets,x,y) and self.fits(rows,width,offsets,x,y+1)):
+                break
+            for step in (-1,1):
+                tx = x
+                moves = []
+                while self.fits(rows,width,offsets,tx,y) and self.fits(rows,width,offsets,tx,y+1):
+                    # The start column is tried only once
+                    if step == -1 or tx != x:
+                        yield self.drop(rows,width,tops,offsets,tx,y),path + moves
+                    tx += step
+                    moves = moves + [engine.ACTION_LEFT if step == -1 else engine.ACTION_RIGHT]
+            path = path + [engine.ACTION_ROTATE]
+
+    def drop(self,rows,width,tops,offsets,x,y):
+        """
+        Drop the block, lock it and remove filled lines. Returns the tuple (lines,new_rows)
+        with the number of removed lines and lines of the new board. The landing line is
+        computed from column tops (lines are checked one by one only if the block is
+        under the overhang).
+
+        Parameters:
+            - rows - list of line masks
+            - width - number of cells in one line
+            - tops - first occupied lines of columns (see get_tops)
+            - offsets - (X,Y) offsets of the rotation state
+            - x,y - position of the block
+        """
+        self.evaluated += 1
+        min_x,max_x,masks,bottoms = self.get_masks(offsets)
+        dist = min([tops[x+min_x+dx] - y - dy - 1 for dx,dy in bottoms])
+        if dist < 0:
+            dist = 0
+            while self.fits(rows,width,offsets,x,y+dist+1):
+                dist += 1
+        y += dist
+        new_rows = list(rows)
+        full = (1 << width) - 1
+        for dy,mask in masks:
+            new_rows[y+dy] |= mask << (x + min_x)
+        kept = [row for row in new_rows if row != full]
+        lines = len(new_rows) - len(kept)
+        return lines,[0]*lines + kept
+
+    def evaluate_next(self,rows,width,kind,rotations,deadline=None):
+        """
+        Returns the best evaluation of the board after the placement of the next block
+        (None if the deadline has passed before all placements were evaluated).
+
+        Parameters:
+            - rows - list of line masks
+            - width - number of cells in one line
+            - kind - type of the next block
+            - rotations - rotation states of the next block
+            - deadline - time.perf_counter() value when the search stops (None means no limit)
+        """
+        key = (tuple(rows),kind)
+        res = self.cache_get(key)
+        if res is not None:
+            return res
+        res = None
+        for value,path in self.get_placements(rows,width,rotations,0,width//2,0):
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            lines,new_rows = value
+            score = WEIGHT_LINES*lines + self.evaluate(new_rows,width)
+            if res is None or score > res:
+                res = score
+        if res is None:
+            # The next block cannot be placed - the game is over
+            res = float("-inf")
+        self.cache_put(key,res)
+        return res
+
+    def evaluate(self,rows,width):
+        """
+        Returns the evaluation of the board (without removed lines).
+
+        Parameters:
+            - rows - list of line masks
+            - width - number of cells in one line
+        """
+        key = tuple(rows)
+        res = self.cache_get(key)
+        if res is not None:
+            return res
+        height = len(rows)
+        heights = [0]*width
+        seen = 0
+        holes = 0
+        for y,row in enumerate(rows):
+            # Holes are empty cells with some shape block above them
+            holes += bin(seen & ~row).count("1")
+            new = row & ~seen
+            x = 0
+            while new:
+                if new & 1:
+                    heights[x] = height - y
+                new >>= 1
+                x += 1
+            seen |= row
+        bumps = sum([abs(heights[i] - heights[i+1]) for i in range(width-1)])
+        res = WEIGHT_HEIGHT*sum(heights) + WEIGHT_HOLES*holes + WEIGHT_BUMPS*bumps
+        self.cache_put(key,res)
+        return res
+
+    def cache_get(self,key):
+        """
+        Returns the cached value or None.
+        """
+        res = self.cache.get(key)
+        if res is not None:
+            self.cache.move_to_end(key)
+        return res
+
+    def cache_put(self,key,value):
+        """
+        Store the value in the cache. The least recently used value is removed
+        if the cache is full.
+        """
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play the headless game with the automatic player.")
+    parser.add_argument("--seed",type=int,default=0,help="seed of the block generator")
+    parser.add_argument("--width",type=int,default=16,help="number of cells in one line")
+    parser.add_argument("--height",type=int,default=28,help="number of lines")
+    parser.add_argument("--pieces",type=int,default=500,help="maximal number of blocks")
+    parser.add_argument("--no-lookahead",action="store_true",help="don't try placements of the next block")
+    parser.add_argument("--realtime",action="store_true",help="limit each search by one move tick of the current speed")
+    args = parser.parse_args()
+
+    eng = engine.Engine(args.width,args.height,seed=args.seed)
+    eng.reset()
+    player = AutoPlayer(lookahead=not args.no_lookahead)
+    while not eng.game_over and eng.pieces <= args.pieces:
+        if args.realtime:
+            eng.step_actions(player.get_moves(eng,eng.get_move_tick()) or [engine.ACTION_DOWN])
+        else:
+            eng.step(player.get_action(eng))
+    print("Score: {0}, lines: {1}, pieces: {2}, speed: {3}x".format(eng.score,eng.lines,eng.pieces,eng.speed))
+    print("Evaluated placements: {0} ({1:.0f} per second), searches took {2:.3f} ms per block".format(
+        player.evaluated,player.placements_per_sec(),1000.0*player.search_time/max(1,eng.pieces)))
+    if args.realtime:
+        print("Searches without all next placements: {0}, over the budget: {1}".format(player.cut,player.over_budget))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+# File: batch.py
+# Description: Batch of tetris games stepped at once with NumPy.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import constants
+import engine
+
+# Boards are surrounded by PAD cells (more than the shape block offset plus one move), the
+# value of cells on the left, right and upper border is WALL, cells below the board are FLOOR
+PAD   = 4
+WALL  = 254
+FLOOR = 255
+
+class BatchEngine(object):
+    """
+    The class with N tetris games which are stepped at once. All boards are stored
+    in one (N,height,width) array and all game rules (moves, rotation, gravity, line
+    removal, score and speed-up) are applied as array operations over the whole batch.
+    Results are the same as from N engine.Engine objects with the same seeds.
+
+    The batch has the fixed cost of NumPy calls in each step, it is faster than the loop
+    over single engines from about 32 games (16x28 boards, see main). Use engine.Engine
+    objects for fewer games.
+
+    The game which has ended is not changed by next steps, use reset to start
+    all games again.
+    """
+
+    def __init__(self,n,width,height,seed=0):
+        """
+        Initialize the batch.
+
+        Parameters:
+            - n - number of games
+            - width - number of cells in one line
+            - height - number of lines
+            - seed - seed of the first game, the game i uses the seed+i
+        """
+        self.n = n
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.start_x = width//2
+        # Prepare table of shape block offsets for all blocks and rotations (from rotation states
+        # of the engine). Blocks without the rotation have the same offsets for all rotations.
+        rotations = engine.BLOCK_ROTATIONS
+        offsets = np.zeros((len(rotations),4,4,2),dtype=np.int64)
+        for i,states in enumerate(rotations):
+            for rot in range(4):
+                offsets[i,rot] = states[rot % len(states)]
+        self.offsets_x = offsets[:,:,:,0]
+        self.offsets_y = offsets[:,:,:,1]
+        # Offsets of shape blocks in the flat array of padded boards
+        self.pad_width = width + 2*PAD
+        self.offsets_flat = self.offsets_y*self.pad_width + self.offsets_x
+        self.rotate_en = np.array([len(states) > 1 for states in rotations])
+        self.block_cnt = len(rotations)
+        self.reset()
+
+    def reset(self,seed=None):
+        """
+        Start new games and return their state.
+
+        Parameters:
+            - seed - seed of the first game (None means to keep the previous seed)
+        """
+        if seed is not None:
+            self.seed = seed
+        n = self.n
+        self.random = [random.Random(self.seed+i) for i in range(n)]
+        # Padded boards, boards are views of their inner cells. Collisions are found by one
+        # lookup in the flat array (the index of the [0,0] cell of each board is in the base).
+        self.padded = np.full((n,self.height+2*PAD,self.pad_width),WALL,dtype=np.uint8)
+        self.padded[:,PAD+self.height:,:] = FLOOR
+        self.boards = self.padded[:,PAD:PAD+self.height,PAD:PAD+self.width]
+        self.boards[...] = 0
+        self.flat = self.padded.reshape(-1)
+        self.base = np.arange(n)*self.padded[0].size + PAD*self.pad_width + PAD
+        self.shape = np.zeros(n,dtype=np.int64)
+        self.rot = np.zeros(n,dtype=np.int64)
+        self.x = np.zeros(n,dtype=np.int64)
+        self.y = np.zeros(n,dtype=np.int64)
+        self.score = np.zeros(n,dtype=np.int64)
+        self.speed = np.ones(n,dtype=np.float64)
+        self.score_level = np.full(n,constants.SCORE_LEVEL,dtype=np.int64)
+        self.lines = np.zeros(n,dtype=np.int64)
+        self.pieces = np.zeros(n,dtype=np.int64)
+        self.game_over = np.zeros(n,dtype=bool)
+        self.get_blocks(np.arange(n))
+        return self.state()
+
+    def state(self):
+        """
+        Returns the dictionary with arrays of the game state (arrays are not copied).
+        """
+        return {
+            "board"     : self.boards,
+            "score"     : self.score,
+            "speed"     : self.speed,
+            "lines"     : self.lines,
+            "pieces"    : self.pieces,
+            "game_over" : self.game_over,
+        }
+
+    def get_cells(self,x,y,shape,rot):
+        """
+        Returns (X,Y) arrays with shape (N,4) with cells of all blocks.
+
+        Parameters:
+            - x,y - arrays with positions of blocks
+            - shape,rot - arrays with the block type and its rotation
+        """
+        return self.offsets_x[shape,rot] + x[:,None],self.offsets_y[shape,rot] + y[:,None]
+
+    def get_used(self,x,y,shape,rot):
+        """
+        Returns the (N,4) array with values of padded board cells under blocks of all games.
+
+        Parameters:
+            - x,y - arrays with positions of blocks
+            - shape,rot - arrays with the block type and its rotation
+        """
+        return self.flat[(self.base + y*self.pad_width + x)[:,None] + self.offsets_flat[shape,rot]]
+
+    def get_collisions(self,x,y,shape,rot):
+        """
+        Detect collisions of blocks in all games. Returns the tuple of boolean arrays
+        (down_board,any_border,block_any) with the same meaning as in engine.Engine.game_logic.
+
+        Parameters:
+            - x,y - arrays with positions of blocks
+            - shape,rot - arrays with the block type and its rotation
+        """
+        used = self.get_used(x,y,shape,rot)
+        return (used == FLOOR).any(axis=1),(used == WALL).any(axis=1),((used != 0) & (used < WALL)).any(axis=1)
+
+    def get_drop_distance(self,idx,x,y,shape,rot):
+        """
+        Returns the array with the number of lines each block can fall (0 for blocks which
+        don't fit on their position). The distance is computed from column tops, lines
+        are checked one by one only for blocks under the overhang.
+
+        Parameters:
+            - idx - indexes of games to work with
+            - x,y - arrays with positions of blocks in these games
+            - shape,rot - arrays with the block type and its rotation
+        """
+        boards = self.boards[idx]
+        cx,cy = self.get_cells(x,y,shape,rot)
+        inside = (cx >= 0) & (cx < self.width) & (cy >= 0) & (cy < self.height)
+        sx = np.clip(cx,0,self.width-1)
+        sy = np.clip(cy,0,self.height-1)
+        games = np.arange(len(idx))[:,None]
+        valid = inside.all(axis=1) & ~(boards[games,sy,sx] != 0).any(axis=1)
+        occupied = boards != 0
+        tops = np.where(occupied.any(axis=1),occupied.argmax(axis=1),self.height)
+        dist = (tops[games,sx] - cy - 1).min(axis=1)
+        # Slow path - move blocks under the overhang down till they collide
+        for i in np.flatnonzero(valid & (dist < 0)):
+            dist[i] = 0
+            while True:
+                ny = cy[i] + dist[i] + 1
+                if (ny >= self.height).any() or boards[i,ny,cx[i]].any():
+                    break
+                dist[i] += 1
+        return np.where(valid,dist,0)
+
+    def step(self,actions):
+        """
+        Run one step of the game logic in all games and return the new state.
+
+        Parameters:
+            - actions - array of N engine.ACTION_* values
+        """
+        actions = np.asarray(actions)
+        live = ~self.game_over
+        # Apply the action to the candidate position
+        nx = self.x + (actions == engine.ACTION_RIGHT) - (actions == engine.ACTION_LEFT)
+        ny = self.y + (actions == engine.ACTION_DOWN)
+        nrot = np.where((actions == engine.ACTION_ROTATE) & self.rotate_en[self.shape],(self.rot+1)%4,self.rot)
+        # Dropped blocks are moved to their landing line and locked there
+        drop = live & (actions == engine.ACTION_DROP)
+        drop_idx = np.flatnonzero(drop)
+        if len(drop_idx):
+            ny[drop_idx] += self.get_drop_distance(drop_idx,nx[drop_idx],ny[drop_idx],self.shape[drop_idx],nrot[drop_idx])
+        # Keep the candidate if there is no collision. The floor and border values are the
+        # highest ones, so the maximal value of cells tells if the block has landed.
+        hit = self.get_used(nx,ny,self.shape,nrot).max(axis=1)
+        down_board = hit == FLOOR
+        ok = live & (hit == 0)
+        self.x = np.where(ok,nx,self.x)
+        self.y = np.where(ok,ny,self.y)
+        self.rot = np.where(ok,nrot,self.rot)
+        # Try to move down (only the collision with other blocks is checked)
+        used = self.get_used(self.x,self.y+1,self.shape,self.rot)
+        can_move_down = ~((used != 0) & (used < WALL)).any(axis=1)
+        over = live & ~can_move_down & (self.x == self.start_x) & (self.y == 0)
+        lock = live & (down_board | ~can_move_down)
+        if len(drop_idx):
+            lock[drop_idx] |= self.get_drop_distance(drop_idx,self.x[drop_idx],self.y[drop_idx],
+                                                     self.shape[drop_idx],self.rot[drop_idx]) == 0
+        self.game_over |= over
+        lock_idx = np.flatnonzero(lock)
+        if len(lock_idx):
+            self.lock_blocks(lock_idx)
+            self.detect_lines(lock_idx)
+            # Generate new blocks where the game continues
+            self.get_blocks(lock_idx[~self.game_over[lock_idx]])
+        return self.state()
+
+    def lock_blocks(self,idx):
+        """
+        Write cells of active blocks into boards (the cell keeps the block type + 1
+        as the engine.Engine does).
+
+        Parameters:
+            - idx - indexes of games to work with
+        """
+        cx,cy = self.get_cells(self.x[idx],self.y[idx],self.shape[idx],self.rot[idx])
+        inside = (cx >= 0) & (cx < self.width) & (cy >= 0) & (cy < self.height)
+        games = np.broadcast_to(idx[:,None],cx.shape)
+        kinds = np.broadcast_to(self.shape[idx][:,None] + 1,cx.shape)
+        self.boards[games[inside],cy[inside],cx[inside]] = kinds[inside]
+
+    def detect_lines(self,idx):
+        """
+        Remove all filled lines at once and update the score and the speed.
+
+        Parameters:
+            - idx - indexes of games to work with
+        """
+        full = self.boards[idx].all(axis=2)
+        cnt = full.sum(axis=1)
+        has = cnt > 0
+        if not has.any():
+            return
+        idx = idx[has]
+        full = full[has]
+        cnt = cnt[has]
+        # Compute the destination line of each kept line - it is moved down by the
+        # number of removed lines below it.
+        below = full[:,::-1].cumsum(axis=1)[:,::-1] - full
+        dest = np.arange(self.height)[None,:] + below
+        sub = self.boards[idx]
+        new = np.zeros_like(sub)
+        games,lines = np.nonzero(~full)
+        new[games,dest[games,lines]] = sub[games,lines]
+        self.boards[idx] = new
+        # Update the score, all lines are scored as one event
+        self.lines[idx] += cnt
+        self.score[idx] += cnt * self.width * constants.POINT_VALUE
+        while True:
+            up = self.score > self.score_level
+            if not up.any():
+                break
+            self.score_level[up] *= constants.SCORE_LEVEL_RATIO
+            self.speed[up]       *= constants.GAME_SPEEDUP_RATIO
+
+    def get_blocks(self,idx):
+        """
+        Generate new blocks into given games.
+
+        Parameters:
+            - idx - indexes of games to work with
+        """
+        for i in idx:
+            self.shape[i] = self.random[i].randint(0,self.block_cnt-1)
+        self.x[idx] = self.start_x
+        self.y[idx] = 0
+        self.rot[idx] = 0
+        self.pieces[idx] += 1
+
+def main():
+    """
+    Compare the speed of the batch with the loop over single games.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the batch tetris engine.")
+    parser.add_argument("--games",type=int,default=256,help="number of games in the batch")
+    parser.add_argument("--steps",type=int,default=1000,help="number of steps")
+    parser.add_argument("--width",type=int,default=16,help="number of cells in one line")
+    parser.add_argument("--height",type=int,default=28,help="number of lines")
+    parser.add_argument("--seed",type=int,default=0,help="seed of the first game")
+    parser.add_argument("--check",action="store_true",help="check that results are the same as from single games")
+    args = parser.parse_args()
+
+    # Random actions with more down moves, the same actions are sent to both variants
+    rnd = np.random.default_rng(args.seed)
+    choices = np.array([engine.ACTION_NONE,engine.ACTION_LEFT,engine.ACTION_RIGHT,engine.ACTION_ROTATE,
+                        engine.ACTION_DOWN,engine.ACTION_DOWN,engine.ACTION_DOWN,engine.ACTION_DROP])
+    actions = choices[rnd.integers(0,len(choices),size=(args.steps,args.games))]
+
+    games = [engine.Engine(args.width,args.height,seed=args.seed+i) for i in range(args.games)]
+    for game in games:
+        game.reset()
+    start = time.perf_counter()
+    for step in range(args.steps):
+        for i,game in enumerate(games):
+            game.step(actions[step,i])
+    single_time = time.perf_counter() - start
+
+    batch = BatchEngine(args.games,args.width,args.height,seed=args.seed)
+    start = time.perf_counter()
+    for step in range(args.steps):
+        batch.step(actions[step])
+    batch_time = time.perf_counter() - start
+
+    total = args.steps*args.games
+    print("single games: {0:.0f} steps/sec".format(total/single_time))
+    print("batch:        {0:.0f} steps/sec".format(total/batch_time))
+
+    if args.check:
+        diff = 0
+        for i,game in enumerate(games):
+            board = np.frombuffer(game.board.cells,dtype=np.uint8).reshape(args.height,args.width)
+            if not (np.array_equal(board,batch.boards[i]) and game.score == batch.score[i] and
+                    game.lines == batch.lines[i] and game.pieces == batch.pieces[i] and
+                    game.speed == batch.speed[i] and game.game_over == batch.game_over[i]):
+                diff += 1
+        print("different games: {0}".format(diff))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+# File: benchmark.py
+# Description: Benchmarks of the game hot paths.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import constants
+import engine
+
+# Board sizes (arguments of the Tetris class) - the default game and large boards
+SIZES = ((16,30),(64,128),(128,256))
+# Seeded board states - name and the part of lines filled by locked blocks
+STATES = (("empty",0.0),("half",0.5),("full",0.9))
+# Allowed slowdown of the benchmark against the baseline (0.1 means 10 %)
+THRESHOLD = 0.1
+
+def measure(func,repeat,rounds=1):
+    """
+    Returns the time of one call of the function in microseconds. The best
+    round is used (other rounds are slowed down by other processes).
+
+    Parameters:
+        - func - function without parameters
+        - repeat - number of calls in one round
+        - rounds - number of rounds
+    """
+    best = None
+    for r in range(rounds):
+        start = time.perf_counter()
+        for i in range(repeat):
+            func()
+        res = (time.perf_counter() - start) * 1e6 / repeat
+        if best is None or res < best:
+            best = res
+    return best
+
+def bench_trial_move(repeat,rounds=1):
+    """
+    Compare the trial move of the active block (can it move down?) done by
+    the backup/move/check/restore of the block with the check_placement call
+    which doesn't change the block.
+
+    Parameters:
+        - repeat - number of calls
+        - rounds - number of rounds
+    """
+    eng = engine.Engine(16,28,seed=0)
+    eng.reset()
+    blk = eng.active_block
+
+    def backup_restore():
+        blk.backup()
+        blk.move(0,constants.BHEIGHT)
+        eng.block_colides()
+        blk.restore()
+
+    def placement():
+        eng.check_placement(blk,blk.x,blk.y+constants.BHEIGHT,blk.rotation)
+
+    return {
+        "trial_move.backup_restore" : measure(backup_restore,repeat,rounds),
+        "trial_move.check_placement" : measure(placement,repeat,rounds),
+    }
+
+def bench_snapshot(repeat,rounds=1):
+    """
+    Measure the snapshot of the game state and its restore.
+
+    Parameters:
+        - repeat - number of calls
+        - rounds - number of rounds
+    """
+    eng = engine.Engine(16,28,seed=0)
+    eng.reset()
+    for i in range(100):
+        eng.step((engine.ACTION_LEFT,engine.ACTION_DOWN,engine.ACTION_ROTATE,engine.ACTION_DOWN)[i % 4])
+    data = eng.snapshot()
+    other = engine.Engine(16,28)
+    return {
+        "snapshot.save"    : measure(eng.snapshot,repeat,rounds),
+        "snapshot.restore" : measure(lambda: other.restore(data),repeat,rounds),
+    }
+
+def make_game(bx,by,fill,seed,view=None):
+    """
+    Create the game with the seeded board state. The given part of lines from the
+    bottom is filled by locked blocks, each filled line has at least one empty cell
+    (so no line can be removed).
+
+    Parameters:
+        - bx,by - arguments of the Tetris class
+        - fill - part of filled lines (0.0 - 1.0)
+        - seed - seed of the board and of the block generator
+        - view - size of the viewport in cells (None means the normal mode)
+    """
+    import tetris
+    game = tetris.Tetris(bx,by,seed=seed,view=view)
+    game.reset()
+    brd = game.board
+    rnd = random.Random(seed)
+    for y in range(brd.height - int(brd.height*fill),brd.height):
+        hole = rnd.randrange(brd.width)
+        cells = [(x,y) for x in range(brd.width) if x != hole and rnd.random() < 0.8]
+        for cell in cells:
+            brd.lock([cell],rnd.randint(1,len(game.block_data)))
+    return game
+
+def bench_game(game,name,repeat,render_repeat,rounds=1):
+    """
+    Measure hot paths of the game (collision check, line removal, rotation and drawing)
+    and return the dictionary with results. Names of results start with the given name.
+
+    Parameters:
+        - game - the tetris.Tetris object (see make_game), the display has to be initialized
+        - name - suffix of result names
+        - repeat - number of calls of the game logic functions
+        - render_repeat - number of calls of drawing functions
+        - rounds - number of rounds
+    """
+    res = {}
+    brd = game.board
+    blk = game.active_block
+
+    # Collision check of the block on all positions and rotations of the board
+    positions = []
+    for y in range(-1,brd.height+1):
+        for x in range(-1,brd.width+1):
+            for rot in range(len(blk.rotations)):
+                positions.append((game.board_x+x*constants.BWIDTH,game.board_y+y*constants.BHEIGHT,rot))
+    args = itertools.cycle(positions)
+    res["collision." + name] = measure(lambda: game.check_placement(blk,*next(args)),repeat,rounds)
+
+    # Removal of four filled lines, the board has to be restored before each call (the copy
+    # of the board is included in the result)
+    cells = bytearray(brd.cells)
+    line_cnt = list(brd.line_cnt)
+    lines = [brd.height-1,brd.height-2,brd.height//2,brd.height//2+1]
+    for y in lines:
+        cells[y*brd.width:(y+1)*brd.width] = bytes([1])*brd.width
+        line_cnt[y] = brd.width
+    saved = (bytes(brd.cells),list(brd.line_cnt),list(brd.tops))
+    # Column tops of the board with filled lines
+    brd.cells[:] = cells
+    brd.update_tops()
+    tops = list(brd.tops)
+
+    def line_clear():
+        brd.cells[:] = cells
+        brd.line_cnt[:] = line_cnt
+        brd.tops[:] = tops
+        game.remove_lines(brd.get_full_lines(lines))
+
+    res["line_clear." + name] = measure(line_clear,repeat,rounds)
+    brd.cells[:] = saved[0]
+    brd.line_cnt[:] = saved[1]
+    brd.tops[:] = saved[2]
+
+    # Rotation of the active block (the block keeps only its position and rotation)
+    res["rotation." + name] = measure(blk.rotate,repeat,rounds)
+
+    # Full redraw of the screen
+    def draw_full():
+        game.full_redraw = True
+        game.draw_game()
+
+    res["draw_full." + name] = measure(draw_full,render_repeat,rounds)
+
+    # Dirty drawing of the block moved to the left and right
+    moves = itertools.cycle((-constants.BWIDTH,constants.BWIDTH))
+    game.full_redraw = True
+    game.draw_game()
+
+    def draw_dirty():
+        blk.move(next(moves),0)
+        game.draw_game()
+
+    res["draw_dirty." + name] = measure(draw_dirty,repeat//10 or 1,rounds)
+    return res
+
+def compare(results,baseline,threshold):
+    """
+    Print results with the change against the baseline. Returns the list of names
+    of results which are slower than the baseline by more than the threshold.
+
+    Parameters:
+        - results - dictionary with results (name -> time in us)
+        - baseline - dictionary with results of the previous run (can be empty)
+        - threshold - allowed slowdown (0.1 means 10 %)
+    """
+    regressions = []
+    for name,value in sorted(results.items()):
+        line = "{0:40s} {1:12.3f} us".format(name,value)
+        old = baseline.get(name)
+        if old:
+            change = value/old - 1.0
+            line += "  {0:+7.1f} %".format(100.0*change)
+            if change > threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the game hot paths.")
+    parser.add_argument("--repeat",type=int,default=20000,help="number of calls of each measured game logic function")
+    parser.add_argument("--render-repeat",type=int,default=20,help="number of full redraws of the screen")
+    parser.add_argument("--rounds",type=int,default=3,help="number of rounds, the best round is used")
+    parser.add_argument("--seed",type=int,default=0,help="seed of board states")
+    parser.add_argument("--sizes",default=",".join(["{0}x{1}".format(*size) for size in SIZES]),
+                        help="comma separated list of board sizes (arguments of the Tetris class)")
+    parser.add_argument("--view",default=None,metavar="WxH",help="use the large board mode with the given viewport size in cells")
+    parser.add_argument("--output",default=None,metavar="FILE",help="write results to the JSON file")
+    parser.add_argument("--baseline",default=None,metavar="FILE",help="compare results with the JSON file of the previous run")
+    parser.add_argument("--threshold",type=float,default=THRESHOLD,help="allowed slowdown against the baseline (0.1 means 10 %%)")
+    args = parser.parse_args()
+
+    # The screen is drawn by the dummy driver (no window, results don't depend on the display)
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    import pygame
+
+    view = tuple([int(v) for v in args.view.split("x")]) if args.view else None
+    results = bench_trial_move(args.repeat,args.rounds)
+    results.update(bench_snapshot(args.repeat,args.rounds))
+    for size in args.sizes.split(","):
+        bx,by = [int(v) for v in size.split("x")]
+        for state,fill in STATES:
+            game = make_game(bx,by,fill,args.seed,view)
+            game.init_display()
+            results.update(bench_game(game,"{0}.{1}".format(size,state),args.repeat,args.render_repeat,args.rounds))
+            pygame.display.quit()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results,baseline,args.threshold)
+
+    if args.output is not None:
+        with open(args.output,"w") as f:
+            json.dump({
+                "python"  : platform.python_version(),
+                "pygame"  : pygame.version.ver,
+                "machine" : platform.machine(),
+                "seed"    : args.seed,
+                "repeat"  : args.repeat,
+                "view"    : args.view,
+                "results" : results,
+            },f,indent=2,sort_keys=True)
+    if regressions:
+        print("{0} results are slower than the baseline by more than {1:.0f} %".format(len(regressions),100.0*args.threshold))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -17,78 +17,165 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import pdb
-
 import constants
-import pygame
-import math
-import copy
-import sys
+
+def get_rotations(shape,rotate_en):
+    """
+    Compute all rotation states of the block. Each state is the tuple of (X,Y)
+    integer offsets of shape blocks. The next state is rotated by 90 degrees
+    around the first shape block.
+
+    Parameters:
+        - shape - list of block data. The list contains [X,Y] coordinates of
+                  building blocks.
+        - rotate_en - enable or disable the rotation (the block without the rotation
+                      has only one state)
+    """
+    states = [tuple([(sh[0],sh[1]) for sh in shape])]
+    if rotate_en:
+        # Use the classic transformation matrix for 90 degrees (cos = 0, sin = 1):
+        # https://www.siggraph.org/education/materials/HyperGraph/modeling/mod_tran/2drota.htm
+        for i in range(3):
+            states.append(tuple([(-y,x) for x,y in states[-1]]))
+    return tuple(states)
+
+# The tile atlas - Surface with pre-drawn shape blocks of all colors in one line and
+# areas of tiles in the atlas (color -> Rect), see get_tile
+ATLAS = None
+TILES = {}
+
+def init_tiles(colors):
+    """
+    Draw tiles of all colors into the new atlas. It is called after the display is
+    initialized, so the atlas is converted to the pixel format of the screen (blits
+    don't convert pixels). Drawing functions import pygame when they are called, the
+    headless engine doesn't need it.
+
+    Parameters:
+        - colors - list of colors in RGB notation
+    """
+    import pygame
+    global ATLAS
+    # One pixel column is added, so lines of the atlas are not aligned to 16 bytes. SDL copies
+    # aligned lines by non-temporal stores which are many times slower for small tiles.
+    ATLAS = pygame.Surface((len(colors)*constants.BWIDTH+1,constants.BHEIGHT))
+    TILES.clear()
+    for i,color in enumerate(colors):
+        area = pygame.Rect(i*constants.BWIDTH,0,constants.BWIDTH,constants.BHEIGHT)
+        pygame.draw.rect(ATLAS,color,area)
+        pygame.draw.rect(ATLAS,constants.BLACK,area,constants.MESH_WIDTH)
+        TILES[color] = area
+    if pygame.display.get_surface() is not None:
+        ATLAS = ATLAS.convert()
+
+def get_tile(color):
+    """
+    Returns the tuple (atlas,area) with the shape block of the given color. The shape
+    block is filled with a color and black border. Tiles are drawn once (the atlas is
+    drawn again with the unknown color) and blitted after that.
+
+    Parameters:
+        - color - the color of the shape block in RGB notation
+    """
+    area = TILES.get(color)
+    if area is None:
+        init_tiles(list(TILES) + [color])
+        area = TILES[color]
+    return ATLAS,area
+
+def draw_shape_block(screen,color,rect):
+    """
+    Draw one shape block. The shape block is filled with a color and black border.
+
+    Parameters:
+        - screen - screen to draw on
+        - color - the color of the shape block in RGB notation
+        - rect - Rect of the shape block
+    """
+    atlas,area = get_tile(color)
+    screen.blit(atlas,rect,area)
+
+def get_rects(blk,dx=0,dy=0):
+    """
+    Returns the list of Rects of shape blocks for drawing. Rects are created from the
+    position of the block when it is drawn, the block keeps only integer positions.
+
+    Parameters:
+        - blk - the Block object
+        - dx,dy - offset added to Rects (e.g., the position of the viewport)
+    """
+    import pygame
+    x = blk.x + dx
+    y = blk.y + dy
+    return [pygame.Rect(x+ox*constants.BWIDTH,y+oy*constants.BHEIGHT,constants.BWIDTH,constants.BHEIGHT)
+            for ox,oy in blk.rotations[blk.rotation]]
+
+def draw_rects(screen,color,rects):
+    """
+    Draw shape blocks of the given color on Rects (see get_rects) by one call.
+
+    Parameters:
+        - screen - screen to draw on
+        - color - the color of shape blocks in RGB notation
+        - rects - list of Rects of shape blocks
+    """
+    atlas,area = get_tile(color)
+    screen.blits([(atlas,rect,area) for rect in rects],doreturn=False)
 
 class Block(object):
     """
-    Class for handling of tetris block
+    Class for handling of the active tetris block. Locked blocks are stored
+    in the board only. The block keeps only its position and rotation, Rects
+    for drawing are created by the drawn game (see get_rects).
     """    
 
-    def __init__(self,shape,x,y,screen,color,rotate_en):
+    __slots__ = ("rotations","rotation","x","y","color","kind","x_copy","y_copy","rotation_copy")
+
+    def __init__(self,rotations,x,y,color,kind=0):
         """
         Initialize the tetris block class
 
         Parameters:
-            - shape - list of block data. The list contains [X,Y] coordinates of
-                      building blocks.
+            - rotations - tuple of rotation states (see get_rotations). The first state
+                          is used.
             - x - X coordinate of first tetris shape block
             - y - Y coordinate of first tetris shape block
-            - screen  - screen to draw on
             - color - the color of each shape block in RGB notation
-            - rotate_en - enable or disable the rotation
-        """
-        # The initial shape (convert all to Rect objects)
-        self.shape = []
-        for sh in shape:
-            bx = sh[0]*constants.BWIDTH + x
-            by = sh[1]*constants.BHEIGHT + y
-            block = pygame.Rect(bx,by,constants.BWIDTH,constants.BHEIGHT)
-            self.shape.append(block)     
-        # Setup the rotation attribute
-        self.rotate_en = rotate_en
-        # Setup the rest of variables
+            - kind - index of the block type (it is stored in the board when the block is locked)
+        """
+        # Rotation states and the index of the current state
+        self.rotations = rotations
+        self.rotation = 0
+        # Position of the first shape block
         self.x = x
         self.y = y
-        # Movement in the X,Y coordinates
-        self.diffx = 0
-        self.diffy = 0
-        # Screen to drawn on
-        self.screen = screen
         self.color = color
-        # Rotation of the screen
-        self.diff_rotation = 0
+        self.kind = kind
 
-    def draw(self):
+    def get_offsets(self):
         """
-        Draw the block from shape blocks. Each shape block
-        is filled with a color and black border.
+        Returns the tuple of (X,Y) offsets of shape blocks in the current rotation.
         """
-        for bl in self.shape:
-            pygame.draw.rect(self.screen,self.color,bl)
-            pygame.draw.rect(self.screen,constants.BLACK,bl,constants.MESH_WIDTH)
-        
-    def get_rotated(self,x,y):
+        return self.rotations[self.rotation]
+
+    def get_state(self):
         """
-        Compute the new coordinates based on the rotation angle.
-        
-        Parameters:
-            - x - the X coordinate to transfer
-            - y - the Y coordinate to transfer
+        Returns the (X,Y,rotation) tuple. The tuple describes the position of the block and
+        it can be compared or used as the dictionary key.
+        """
+        return (self.x,self.y,self.rotation)
 
-        Returns the tuple with new (X,Y) coordinates.
+    def set_state(self,x,y,rotation):
         """
-        # Use the classic transformation matrix:
-        # https://www.siggraph.org/education/materials/HyperGraph/modeling/mod_tran/2drota.htm
-        rads = self.diff_rotation * (math.pi / 180.0)
-        newx = x*math.cos(rads) - y*math.sin(rads)
-        newy = y*math.cos(rads) + x*math.sin(rads)
-        return (newx,newy)        
+        Move the block to the given position and rotation.
+
+        Parameters:
+            - x,y - position of the first shape block
+            - rotation - index of the rotation state
+        """
+        self.x = x
+        self.y = y
+        self.rotation = rotation
 
     def move(self,x,y):
         """
@@ -98,106 +185,29 @@ class Block(object):
             - x - movement in the X coordinate
             - y - movement in the Y coordinate 
         """
-        # Accumulate X,Y coordinates and call the update function       
-        self.diffx += x
-        self.diffy += y  
-        self._update()
-
-    def remove_blocks(self,y):
-        """
-        Remove blocks on the Y coordinate. All blocks
-        above the Y are moved one step down. 
-
-        Parameters:
-            - y - Y coordinate to work with.
-        """
-        new_shape = []
-        for shape_i in range(len(self.shape)):
-            tmp_shape = self.shape[shape_i]
-            if tmp_shape.y < y:
-                # Block is above the y, move down and add it to the list of active shape
-                # blocks.
-                new_shape.append(tmp_shape)  
-                tmp_shape.move_ip(0,constants.BHEIGHT)
-            elif tmp_shape.y > y:
-                # Block is below the y, add it to the list. The block doesn't need to be moved because
-                # the removed line is above it.
-                new_shape.append(tmp_shape)
-        # Setup the new list of block shapes.
-        self.shape = new_shape
-
-    def has_blocks(self):
-        """
-        Returns true if the block has some shape blocks in the shape list.
-        """    
-        return True if len(self.shape) > 0 else False
+        self.x += x
+        self.y += y
 
     def rotate(self):
         """
-        Setup the rotation value to 90 degrees.
-        """
-        # Setup the rotation and update coordinates of all shape blocks.
-        # The block is rotated iff the rotation is enabled
-        if self.rotate_en:
-            self.diff_rotation = 90
-            self._update()
-
-    def _update(self):
-        """
-        Update the position of all shape boxes.
-        """
-        for bl in self.shape:
-            # Get old coordinates and compute new x,y coordinates. 
-            # All rotation calculates are done in the original coordinates.
-            origX = (bl.x - self.x)/constants.BWIDTH
-            origY = (bl.y - self.y)/constants.BHEIGHT
-            rx,ry = self.get_rotated(origX,origY)
-            newX = rx*constants.BWIDTH  + self.x + self.diffx
-            newY = ry*constants.BHEIGHT + self.y + self.diffy
-            # Compute the relative move
-            newPosX = newX - bl.x
-            newPosY = newY - bl.y
-            bl.move_ip(newPosX,newPosY)
-        # Everyhting was moved. Setup new x,y, coordinates and reset all disable the move
-        # variables.
-        self.x += self.diffx
-        self.y += self.diffy
-        self.diffx = 0
-        self.diffy = 0
-        self.diff_rotation = 0
+        Rotate the block by 90 degrees (switch to the next rotation state).
+        """
+        # The block is rotated iff it has more rotation states
+        if len(self.rotations) > 1:
+            self.rotation = (self.rotation + 1) % len(self.rotations)
 
     def backup(self):
         """
         Backup the current configuration of shape blocks.
         """
-        # Make the deep copy of the shape list. Also, remember
-        # the current configuration.
-        self.shape_copy = copy.deepcopy(self.shape)
         self.x_copy = self.x
         self.y_copy = self.y
-        self.rotation_copy = self.diff_rotation     
+        self.rotation_copy = self.rotation
 
     def restore(self):
         """
         Restore the previous configuraiton.
         """
-        self.shape = self.shape_copy
         self.x = self.x_copy
         self.y = self.y_copy
-        self.diff_rotation = self.rotation_copy
-
-    def check_collision(self,rect_list):
-        """
-        The function checks if the block colides with any other block
-        in the shape list. 
-
-        Parameters:
-            - rect_list - the function accepts the list of Rect object which
-                         are used for the collistion detection. 
-        """
-        for blk in rect_list:
-            collist = blk.collidelistall(self.shape)
-            if len(collist):
-                return True
-        return False
-
+        self.rotation = self.rotation_copy
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+# File: board.py
+# Description: Occupancy grid of the tetris play board.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+
+class Board(object):
+    """
+    Class with the occupancy grid of the play board. The grid is stored
+    in the flat bytearray (one byte per cell, row after row) and it contains
+    only locked shape blocks. The value of the empty cell is 0, the occupied
+    cell keeps the index of the block type + 1 (it gives the color). All
+    coordinates are in cells, the [0,0] cell is the upper left cell of the board.
+    """
+
+    def __init__(self,width,height):
+        """
+        Initialize the board.
+
+        Parameters:
+            - width - number of cells in one line
+            - height - number of lines
+        """
+        self.width = width
+        self.height = height
+        self.cells = bytearray(width*height)
+        # Number of occupied cells in each line
+        self.line_cnt = [0]*height
+        # The first occupied line of each column (the height means the empty column)
+        self.tops = [height]*width
+
+    def is_inside(self,x,y):
+        """
+        Returns true if the X,Y cell is inside the board.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def hits_floor(self,cells):
+        """
+        Returns true if any of cells is below the last line.
+
+        Parameters:
+            - cells - list of (X,Y) cells to check
+        """
+        for x,y in cells:
+            if y >= self.height:
+                return True
+        return False
+
+    def hits_wall(self,cells):
+        """
+        Returns true if any of cells is outside the left, right or upper border.
+
+        Parameters:
+            - cells - list of (X,Y) cells to check
+        """
+        for x,y in cells:
+            if x < 0 or x >= self.width or y < 0:
+                return True
+        return False
+
+    def occupied(self,cells):
+        """
+        Returns true if any of cells is inside the board and it is already
+        used by some locked block. Cells outside the board are ignored.
+
+        Parameters:
+            - cells - list of (X,Y) cells to check
+        """
+        width = self.width
+        for x,y in cells:
+            if 0 <= x < width and 0 <= y < self.height and self.cells[y*width+x]:
+                return True
+        return False
+
+    def collides(self,cells):
+        """
+        Returns true if cells cannot be placed on the board (any cell is outside
+        the board or it is occupied).
+
+        Parameters:
+            - cells - list of (X,Y) cells to check
+        """
+        width = self.width
+        for x,y in cells:
+            if not (0 <= x < width and 0 <= y < self.height) or self.cells[y*width+x]:
+                return True
+        return False
+
+    def lock(self,cells,value=1):
+        """
+        Mark cells as occupied and update counters of occupied cells in
+        affected lines. Cells outside the board are ignored.
+
+        Parameters:
+            - cells - list of (X,Y) cells to lock
+            - value - value stored in cells (1-255)
+        """
+        for x,y in cells:
+            if self.is_inside(x,y):
+                if not self.cells[y*self.width+x]:
+                    self.line_cnt[y] += 1
+                self.cells[y*self.width+x] = value
+                if y < self.tops[x]:
+                    self.tops[x] = y
+
+    def get_full_lines(self,lines):
+        """
+        Returns the sorted list of filled lines.
+
+        Parameters:
+            - lines - Y coordinates of lines to check (typically lines of the
+                      last locked block)
+        """
+        return sorted(set([y for y in lines if 0 <= y < self.height and self.line_cnt[y] == self.width]))
+
+    def remove_lines(self,lines):
+        """
+        Remove all given lines in one pass. Remaining lines are moved down to
+        fill the space and the same number of empty lines is added to the top
+        of the board.
+
+        Parameters:
+            - lines - Y coordinates of lines to remove
+        """
+        if not lines:
+            return
+        width = self.width
+        removed = set(lines)
+        # Compact the board from the lowest removed line (lines below are untouched). The dst
+        # line is the first line which can be overwritten by the line above.
+        dst = max(removed)
+        for src in range(dst,-1,-1):
+            if src in removed:
+                continue
+            if dst != src:
+                self.cells[dst*width:(dst+1)*width] = self.cells[src*width:(src+1)*width]
+                self.line_cnt[dst] = self.line_cnt[src]
+            dst -= 1
+        # Clear lines on the top
+        self.cells[0:(dst+1)*width] = bytes((dst+1)*width)
+        for y in range(dst+1):
+            self.line_cnt[y] = 0
+        # Tops of columns move down by the number of removed lines below them. Only columns
+        # with the top in the removed line are searched again (from the new position of the
+        # line), empty lines are skipped.
+        height = self.height
+        ordered = sorted(removed)
+        rescan = []
+        for x,top in enumerate(self.tops):
+            if top == height:
+                continue
+            self.tops[x] = top + len(ordered) - bisect.bisect_right(ordered,top)
+            if top in removed:
+                rescan.append(x)
+        if rescan:
+            used = [y for y in range(dst+1,height) if self.line_cnt[y]]
+            cells = self.cells
+            for x in rescan:
+                top = height
+                for y in used[bisect.bisect_left(used,self.tops[x]):]:
+                    if cells[y*width+x]:
+                        top = y
+                        break
+                self.tops[x] = top
+
+    def update_tops(self,start=None):
+        """
+        Find the first occupied line of all columns.
+
+        Parameters:
+            - start - list with the first line of each column where the search starts
+                      (None means to search from the first line)
+        """
+        width = self.width
+        cells = self.cells
+        for x in range(width):
+            y = start[x] if start is not None else 0
+            while y < self.height and not cells[y*width+x]:
+                y += 1
+            self.tops[x] = y
+
+    def drop_distance(self,cells):
+        """
+        Returns the number of lines the cells can move down before they hit locked
+        blocks or the floor. The distance is computed from column tops, lines are checked
+        one by one only if some cell is below the top of its column (under the overhang).
+
+        Parameters:
+            - cells - list of (X,Y) cells (they have to be inside the left and right border)
+        """
+        dist = self.height
+        for x,y in cells:
+            d = self.tops[x] - y - 1
+            if d < dist:
+                dist = d
+        if dist >= 0:
+            return dist
+        # Slow path - move cells down till they collide
+        dist = 0
+        while not self.collides([(x,y+dist+1) for x,y in cells if y+dist+1 >= 0]):
+            dist += 1
+        return dist
@@ -17,9 +17,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-
-from pygame.locals import *
-
 # Configuration of building shape block
 # Width of the shape block
 BWIDTH     = 20
@@ -27,6 +24,8 @@ BWIDTH     = 20
 BHEIGHT    = 20
 # Width of the line around the block
 MESH_WIDTH = 1
+# Width of the border of the ghost piece (the landing position of the block)
+GHOST_WIDTH = 2
 
 # Configuration of the player board
 # Board line height
@@ -48,16 +47,22 @@ CYAN     = (0,255,255)
 BLACK    = (0,0,0)
 
 # Timing constraints
-# Time for the generation of TIME_MOVE_EVENT (ms)
+# Time between gravity moves of the block (ms of the game time)
 MOVE_TICK          = 1000
-# Allocated number for the move dowon event
-TIMER_MOVE_EVENT   = USEREVENT+1
+# Maximal real time of gravity moves run in one frame (ms), the rest is run in next frames
+SIM_MAX_TIME       = 20
 # Speed up ratio of the game (integer values)
 GAME_SPEEDUP_RATIO = 1.5
 # Score LEVEL - first threshold of the score
 SCORE_LEVEL        = 2000
 # Score level ratio
 SCORE_LEVEL_RATIO  = 2 
+# Maximal number of drawn frames per second
+MAX_FPS            = 60
+# Auto-repeat of held keys - the delay before the first repeat (DAS) and the time
+# between repeats (ARR) in ms
+KEY_REPEAT_DELAY   = 170
+KEY_REPEAT_INTERVAL = 50
 
 # Configuration of score
 # Number of points for one building block
@@ -67,3 +72,36 @@ POINT_MARGIN      = 10
 
 # Font size for all strings (score, pause, game over)
 FONT_SIZE           = 25
+# Number of rendered strings kept in the cache
+TEXT_CACHE_SIZE     = 16
+# Number of evaluated boards kept in the cache of the automatic player
+AI_CACHE_SIZE       = 100000
+# Number of frames kept by the profiler
+PROFILE_FRAMES      = 1024
+# Height of the profiler overlay (below the board)
+PROFILE_HEIGHT      = 30
+# Font size of the profiler overlay
+PROFILE_FONT_SIZE   = 18
+# Number of frames between updates of the profiler overlay
+PROFILE_PERIOD      = 15
+
+# Configuration of the large board mode (see viewport.py)
+# Size of the chunk (number of cells in both directions)
+CHUNK_SIZE          = 16
+# Maximal number of stored chunks
+CHUNK_CACHE         = 128
+# Minimal distance of the active block from the viewport border (cells)
+VIEW_MARGIN         = 4
+# Size of the viewport (cells) used for boards which cannot be shown in the normal mode
+VIEW_SIZE           = (32,40)
+
+# Configuration of the game server (see server.py)
+# Default port of the server
+SERVER_PORT         = 9999
+# Maximal number of bytes read from the client at once
+SERVER_READ_SIZE    = 4096
+# Maximal number of unsent bytes, the slower client is disconnected
+SERVER_WRITE_LIMIT  = 1 << 20
+# Resolution of the timer wheel (ms) and the number of its slots
+WHEEL_RESOLUTION    = 10
+WHEEL_SIZE          = 512
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+
+# File: engine.py
+# Description: Tetris game rules without any display (headless engine).
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import random
+import math
+import struct
+import block
+import board
+import constants
+
+# Actions accepted by the step function
+ACTION_NONE   = 0
+ACTION_LEFT   = 1
+ACTION_RIGHT  = 2
+ACTION_DOWN   = 3
+ACTION_ROTATE = 4
+ACTION_DROP   = 5
+
+# Block data (shapes and colors). The shape is encoded in the list of [X,Y] points. Each point
+# represents the relative position. The true/false value is used for the configuration of rotation where
+# False means no rotate and True allows the rotation.
+BLOCK_DATA = (
+    ([[0,0],[1,0],[2,0],[3,0]],constants.RED,True),     # I block
+    ([[0,0],[1,0],[0,1],[-1,1]],constants.GREEN,True),  # S block
+    ([[0,0],[1,0],[2,0],[2,1]],constants.BLUE,True),    # J block
+    ([[0,0],[0,1],[1,0],[1,1]],constants.ORANGE,False), # O block
+    ([[-1,0],[0,0],[0,1],[1,1]],constants.GOLD,True),   # Z block
+    ([[0,0],[1,0],[2,0],[1,1]],constants.PURPLE,True),  # T block
+    ([[0,0],[1,0],[2,0],[0,1]],constants.CYAN,True),    # J block
+)
+
+# Rotation states of all blocks (integer offsets), computed once
+BLOCK_ROTATIONS = tuple([block.get_rotations(data[0],data[2]) for data in BLOCK_DATA])
+
+# Game state snapshot (see Engine.snapshot). The header contains the magic, version, width
+# and height, the seed (with the flag of the known seed), score, score level, speed, removed lines,
+# generated blocks, tick, flags (game over, new block, active block), the active block (type, X and Y
+# in cells, rotation) and the type of the next block (-1 means unknown). Cells of the board, numbers
+# of occupied cells in lines, first occupied lines of columns (2 bytes per number) and the state of
+# the block generator follow the header. The generator state is the flag of the stored
+# gauss value with the value and 625 words of the Mersenne Twister.
+SNAPSHOT_MAGIC   = b"TTSS"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER  = struct.Struct("<4sBHHBqqqdqqqBBBBhhBb")
+SNAPSHOT_GAUSS   = struct.Struct("<Bd")
+SNAPSHOT_RANDOM  = SNAPSHOT_GAUSS.size + 625*4
+
+class Engine(object):
+    """
+    The class with implementation of tetris game rules. The engine doesn't draw
+    anything and it doesn't use the pygame event queue, so it can be used for
+    simulations without the display:
+
+        eng = Engine(16,28,seed=1)
+        eng.reset()
+        while not eng.game_over:
+            eng.step(ACTION_DOWN)
+
+    The gravity is not applied automatically, it is the ACTION_DOWN action which
+    has to be sent every get_move_tick() milliseconds of the game time.
+    """
+
+    def __init__(self,width,height,seed=None):
+        """
+        Initialize the engine.
+
+        Parameters:
+            - width - number of cells in one line
+            - height - number of lines
+            - seed - seed of the block generator (None means random seed)
+        """
+        # Block data and rotation states of blocks
+        self.block_data = BLOCK_DATA
+        self.block_rotations = BLOCK_ROTATIONS
+        self.blocks_in_line = width
+        self.blocks_in_pile = height
+        # Blocks are stored in the same units as in the drawn game (pixels) but the board
+        # starts on [0,0]. Start position is in the middle of the first line.
+        self.board_x = 0
+        self.board_y = 0
+        self.start_x = (width//2)*constants.BWIDTH
+        self.start_y = 0
+        self.seed = seed
+        self.init_game()
+
+    def init_game(self):
+        """
+        Initialize the game state (board, score, speed and the block generator).
+        """
+        self.board = board.Board(self.blocks_in_line,self.blocks_in_pile)
+        self.random = random.Random(self.seed)
+        # The stored state of the generator for snapshots - (number of generated blocks,state). The
+        # generator is used only for new blocks, so the state is valid till the next block.
+        self.random_state = None
+        self.active_block = None
+        # Type of the next block
+        self.next_kind = None
+        # Score settings
+        self.score = 0
+        # Remember the current speed
+        self.speed = 1
+        # The score level threshold
+        self.score_level = constants.SCORE_LEVEL
+        # Statistics - number of removed lines and generated blocks
+        self.lines = 0
+        self.pieces = 0
+        # Number of finished game logic steps and actions of the current step
+        self.tick = 0
+        self.actions = []
+        # NumPy arrays of the game state (see observe), they are created for the new board
+        self.observation = None
+        # The block has landed in the current step (it reached the floor or it was dropped),
+        # it is locked by the game logic
+        self.landed = False
+        # Control variables (see the Tetris.run function)
+        self.done = False
+        self.game_over = False
+        self.new_block = True
+
+    def reset(self,seed=None):
+        """
+        Start the new game and return its state.
+
+        Parameters:
+            - seed - seed of the block generator (None means to keep the previous seed)
+        """
+        if seed is not None:
+            self.seed = seed
+        self.init_game()
+        self.get_block()
+        return self.state()
+
+    def step(self,action):
+        """
+        Run one step of the game logic with the given action and return the
+        new state. The new block is generated if the active one was locked.
+
+        Parameters:
+            - action - one of ACTION_* values
+        """
+        return self.step_actions([action])
+
+    def step_actions(self,actions):
+        """
+        Run one step of the game logic with the list of actions and return the new
+        state. Each action is checked against the board on its own (as the drawn game
+        does with all events received in one frame), see do_action.
+
+        Parameters:
+            - actions - list of ACTION_* values
+        """
+        if not self.game_over:
+            self.get_block()
+            self.actions = actions
+            self.game_logic()
+            self.actions = []
+            if not self.game_over:
+                self.get_block()
+        return self.state()
+
+    def state(self):
+        """
+        Returns the dictionary with the game state. The board is a bytes object with
+        one byte per cell (non-zero value means the occupied cell, see board.Board), the
+        block is the list of (X,Y) cells of the active block.
+        """
+        return {
+            "board"     : bytes(self.board.cells),
+            "block"     : self.get_cells(self.active_block) if self.active_block else [],
+            "score"     : self.score,
+            "speed"     : self.speed,
+            "lines"     : self.lines,
+            "pieces"    : self.pieces,
+            "game_over" : self.game_over,
+            "tick"      : self.tick,
+        }
+
+    def observe(self):
+        """
+        Returns the dictionary with read-only NumPy arrays of the game state (board,
+        active block mask, one-hot next block, features and counters), see observation.Observation.
+        The board array is the view of the board memory and all arrays are updated in
+        place, so they can be kept till the next reset. NumPy is imported by the first
+        call.
+        """
+        if self.observation is None:
+            import observation
+            self.observation = observation.Observation(self)
+        return self.observation.update()
+
+    def copy_from(self,other):
+        """
+        Copy the game state from another engine with the same board size. The
+        other engine can use different screen coordinates (e.g., the headless engine
+        and the drawn game).
+
+        Parameters:
+            - other - engine to copy from
+        """
+        self.restore(other.snapshot())
+
+    def snapshot(self):
+        """
+        Returns the bytes object with the whole game state (board, active block, score,
+        speed and the state of the block generator), see restore. Positions are stored
+        in cells, so the snapshot can be restored by the engine with different screen
+        coordinates.
+        """
+        blk = self.active_block
+        x = y = kind = rotation = 0
+        if blk is not None:
+            x = (blk.x - self.board_x)//constants.BWIDTH
+            y = (blk.y - self.board_y)//constants.BHEIGHT
+            kind = blk.kind
+            rotation = blk.rotation
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC,SNAPSHOT_VERSION,self.blocks_in_line,self.blocks_in_pile,
+                                      self.seed is not None,self.seed or 0,self.score,self.score_level,self.speed,
+                                      self.lines,self.pieces,self.tick,self.game_over,self.new_block,blk is not None,
+                                      kind,x,y,rotation,-1 if self.next_kind is None else self.next_kind)
+        if self.random_state is None or self.random_state[0] != self.pieces:
+            version,state,gauss = self.random.getstate()
+            self.random_state = (self.pieces,SNAPSHOT_GAUSS.pack(gauss is not None,gauss or 0.0) + array.array("I",state).tobytes())
+        return b"".join((header,self.board.cells,array.array("H",self.board.line_cnt).tobytes(),
+                         array.array("H",self.board.tops).tobytes(),self.random_state[1]))
+
+    def restore(self,data):
+        """
+        Restore the game state from the snapshot (see snapshot). The board size has
+        to be the same.
+
+        Parameters:
+            - data - bytes-like object (bytes, bytearray or memoryview) with the snapshot
+        """
+        (magic,version,width,height,has_seed,seed,score,score_level,speed,lines,pieces,tick,game_over,
+         new_block,has_block,kind,x,y,rotation,next_kind) = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("Unsupported game snapshot")
+        if width != self.blocks_in_line or height != self.blocks_in_pile:
+            raise ValueError("The snapshot has a different board size ({0}x{1})".format(width,height))
+        pos = SNAPSHOT_HEADER.size
+        brd = self.board
+        brd.cells[:] = data[pos:pos+width*height]
+        pos += width*height
+        line_cnt = array.array("H")
+        line_cnt.frombytes(data[pos:pos+2*height])
+        brd.line_cnt[:] = line_cnt
+        pos += 2*height
+        tops = array.array("H")
+        tops.frombytes(data[pos:pos+2*width])
+        brd.tops[:] = tops
+        pos += 2*width
+        # The generator is not changed if it has the same state. The stored state is valid only
+        # if no block was generated after it was stored (the generator has moved on otherwise).
+        random_state = bytes(data[pos:pos+SNAPSHOT_RANDOM])
+        if self.random_state is None or self.random_state[0] != self.pieces or self.random_state[1] != random_state:
+            has_gauss,gauss = SNAPSHOT_GAUSS.unpack_from(random_state)
+            state = array.array("I")
+            state.frombytes(random_state[SNAPSHOT_GAUSS.size:])
+            self.random.setstate((3,tuple(state),gauss if has_gauss else None))
+        self.random_state = (pieces,random_state)
+        self.seed = seed if has_seed else None
+        self.score = score
+        self.score_level = score_level
+        self.speed = speed
+        self.lines = lines
+        self.pieces = pieces
+        self.tick = tick
+        self.game_over = bool(game_over)
+        self.new_block = bool(new_block)
+        self.next_kind = None if next_kind < 0 else next_kind
+        self.active_block = None
+        if has_block:
+            x = self.board_x + x*constants.BWIDTH
+            y = self.board_y + y*constants.BHEIGHT
+            self.active_block = block.Block(self.block_rotations[kind],x,y,self.block_data[kind][1],kind)
+            self.active_block.set_state(x,y,rotation)
+
+    def get_move_tick(self):
+        """
+        Returns the time between two down moves (ms) for the current speed. Minimal
+        allowed value is 1.
+        """
+        return max(1,math.floor(constants.MOVE_TICK / self.speed))
+
+    def set_move_timer(self):
+        """
+        Called when the game speed is changed. The engine has no timer, the
+        gravity is driven by the caller (see get_move_tick).
+        """
+        pass
+
+    def apply_action(self):
+        """
+        Apply actions passed to the step function.
+        """
+        for action in self.actions:
+            self.do_action(action)
+
+    def do_action(self,action):
+        """
+        Move or rotate the active block. The new position is checked against the board
+        right away, the action which doesn't fit is ignored and it doesn't affect other
+        actions of the step. The block which touches the down border (or which was dropped)
+        has landed, it is locked by the game logic and following actions of the step are
+        ignored.
+
+        Parameters:
+            - action - one of ACTION_* values
+        """
+        blk = self.active_block
+        if self.landed or action == ACTION_NONE:
+            return
+        x,y,rotation = blk.get_state()
+        if action == ACTION_DOWN:
+            y += constants.BHEIGHT
+        elif action == ACTION_LEFT:
+            x -= constants.BWIDTH
+        elif action == ACTION_RIGHT:
+            x += constants.BWIDTH
+        elif action == ACTION_ROTATE:
+            rotation = (rotation + 1) % len(blk.rotations)
+        elif action == ACTION_DROP:
+            y += self.get_drop_distance(blk,x,y,rotation)*constants.BHEIGHT
+            self.landed = True
+        # Border logic, check if we colide with down border or any
+        # other border. This check also includes the detection with other tetris blocks.
+        down_board,any_border,block_any = self.check_placement(blk,x,y,rotation)
+        if down_board:
+            self.landed = True
+        elif not (any_border or block_any) and (x,y,rotation) != blk.get_state():
+            blk.set_state(x,y,rotation)
+
+    def get_cells(self,blk):
+        """
+        Get the list of (X,Y) board cells covered by the block.
+
+        Parameters:
+            - blk - block to convert
+        """
+        return self.get_cells_at(blk,blk.x,blk.y,blk.rotation)
+
+    def get_cells_at(self,blk,x,y,rotation):
+        """
+        Get the list of (X,Y) board cells which would be covered by the block
+        on the given position and rotation. The block is not changed.
+
+        Parameters:
+            - blk - block to convert
+            - x,y - position of the block
+            - rotation - index of the rotation state
+        """
+        x = (x - self.board_x)//constants.BWIDTH
+        y = (y - self.board_y)//constants.BHEIGHT
+        return [(x+dx,y+dy) for dx,dy in blk.rotations[rotation]]
+
+    def check_placement(self,blk,x,y,rotation):
+        """
+        Check the block on the given position and rotation against the board. The block
+        is not changed or copied. Returns the (down_board,any_border,block_any) tuple
+        of collision flags with the down border, other borders and locked blocks.
+
+        Parameters:
+            - blk - block to check
+            - x,y - position of the block
+            - rotation - index of the rotation state
+        """
+        cells = self.get_cells_at(blk,x,y,rotation)
+        return (self.board.hits_floor(cells),self.board.hits_wall(cells),self.board.occupied(cells))
+
+    def can_place(self,blk,x,y,rotation):
+        """
+        Returns true if the block can be placed on the given position and rotation.
+        The block is not changed or copied.
+
+        Parameters:
+            - blk - block to check
+            - x,y - position of the block
+            - rotation - index of the rotation state
+        """
+        return not self.board.collides(self.get_cells_at(blk,x,y,rotation))
+
+    def can_fall(self,blk):
+        """
+        Returns true if the block can move one line down (the gravity check). The block
+        is not changed or copied.
+
+        Parameters:
+            - blk - block to check
+        """
+        return not self.board.occupied(self.get_cells_at(blk,blk.x,blk.y+constants.BHEIGHT,blk.rotation))
+
+    def get_drop_distance(self,blk,x,y,rotation):
+        """
+        Returns the number of lines the block can fall from the given position and
+        rotation (0 if the block doesn't fit there). The distance is computed from
+        column tops of the board (see board.Board.drop_distance).
+
+        Parameters:
+            - blk - block to check
+            - x,y - position of the block
+            - rotation - index of the rotation state
+        """
+        cells = self.get_cells_at(blk,x,y,rotation)
+        if self.board.collides(cells):
+            return 0
+        return self.board.drop_distance(cells)
+
+    def block_colides(self):
+        """
+        Check if the block colides with any other block.
+
+        The function returns True if the collision is detected.
+        """
+        return self.board.occupied(self.get_cells(self.active_block))
+
+    def game_logic(self):
+        """
+        Implementation of the main game logic. This function detects colisions
+        and insertion of new tetris blocks.
+        """
+        # Apply actions, each of them moves the block only if the new position fits
+        blk = self.active_block
+        self.landed = False
+        self.apply_action()
+        # So far so good, try the position one step down (to detect the colision with other block).
+        # After that, detect the the insertion of new block. The block new block is inserted if we reached the boarder
+        # or we cannot move down.
+        can_move_down = self.can_fall(blk)
+        # We end the game if we are on the respawn and we cannot move --> bang!
+        if not can_move_down and (self.start_x == blk.x and self.start_y == blk.y):
+            self.game_over = True
+        # The new block is inserted if we reached down board or we cannot move down.
+        if self.landed or not can_move_down:
+            # Request new block and remember its cells in the occupancy grid
+            self.new_block = True
+            self.lock_block(blk)
+            # Detect the filled line and possibly remove the line from the
+            # screen.
+            self.detect_line()
+        self.tick += 1
+
+    def lock_block(self,blk):
+        """
+        Lock the block in the board (the cell keeps the block type + 1).
+
+        Parameters:
+            - blk - block to lock
+        """
+        self.board.lock(self.get_cells(blk),blk.kind+1)
+
+    def detect_line(self):
+        """
+        Detect if lines are filled. If yes, remove all filled lines at once and
+        move with remaining bulding blocks to new positions.
+        """
+        # Only lines of the non-moving tetris block can be filled. Number of used cells
+        # in each line is tracked by the board, so the check is cheap.
+        lines = self.board.get_full_lines([y for x,y in self.get_cells(self.active_block)])
+        if not lines:
+            return
+        # Ok, full lines are detected!
+        self.remove_lines(lines)
+        self.lines += len(lines)
+        # Update the score, all lines are scored as one event.
+        self.update_score(len(lines))
+
+    def update_score(self,lines):
+        """
+        Update the score and the game speed after removing of filled lines.
+
+        Parameters:
+            - lines - number of removed lines
+        """
+        self.score += lines * self.blocks_in_line * constants.POINT_VALUE
+        # Check if we need to speed up the game. If yes, change control variables.
+        # More levels can be reached by one multi-line removal.
+        speed = self.speed
+        while self.score > self.score_level:
+            self.score_level *= constants.SCORE_LEVEL_RATIO
+            self.speed       *= constants.GAME_SPEEDUP_RATIO
+        # Change the game speed
+        if speed != self.speed:
+            self.set_move_timer()
+
+    def remove_lines(self,lines):
+        """
+        Remove lines with given Y coordinates from the board.
+
+        Parameters:
+            - lines - Y coordinates of lines in board cells.
+        """
+        self.board.remove_lines(lines)
+
+    def get_block(self):
+        """
+        Generate new block into the game if is required.
+        """
+        if self.new_block:
+            # The type of the next block is known in advance (the order of generated
+            # blocks is the same)
+            if self.next_kind is None:
+                self.next_kind = self.random.randint(0,len(self.block_data)-1)
+            tmp = self.next_kind
+            self.next_kind = self.random.randint(0,len(self.block_data)-1)
+            data = self.block_data[tmp]
+            self.active_block = block.Block(self.block_rotations[tmp],self.start_x,self.start_y,data[1],tmp)
+            self.new_block = False
+            self.pieces += 1
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# File: observation.py
+# Description: NumPy views of the game state for learning pipelines.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+
+import numpy as np
+
+# Names of values in the features array (float32) and in the counters array (int64).
+# Counters grow without a limit, float32 keeps integers exactly only up to 2^24.
+FEATURES = ("speed","game_over")
+COUNTERS = ("score","lines","pieces","tick")
+
+# NumPy types of array.array type codes
+DTYPES = {"f" : np.float32, "q" : np.int64}
+
+def get_view(buf,shape):
+    """
+    Returns the read-only NumPy array (uint8 for bytearrays, the type of the type code
+    for array.array, see DTYPES) which shares the memory with the buffer.
+
+    Parameters:
+        - buf - bytearray or array.array with the data
+        - shape - shape of the returned array
+    """
+    dtype = DTYPES[buf.typecode] if isinstance(buf,array.array) else np.uint8
+    view = np.frombuffer(buf,dtype=dtype).reshape(shape)
+    view.flags.writeable = False
+    return view
+
+class Observation(object):
+    """
+    The game state of one engine as read-only NumPy arrays:
+
+        - board - (height,width) uint8 array with locked cells (the block type + 1, 0 is
+                  the empty cell). It is the view of the board bytearray, nothing is copied.
+        - piece - (height,width) uint8 mask of the active block (1 for its cells)
+        - next - uint8 one-hot array of the next block type (zeros if it is not known)
+        - features - float32 array with values named by FEATURES (the speed and the game
+                     over flag)
+        - counters - int64 array with values named by COUNTERS (the score, removed lines,
+                     locked pieces and the tick), they are exact for any value
+
+    Arrays are created once and they are updated in place by the update function, so
+    the caller can keep them. Only cells of the moved active block are changed, the
+    board is never converted. Arrays are valid till the engine starts the new game
+    (it creates the new board, see engine.Engine.observe).
+    """
+
+    def __init__(self,eng):
+        """
+        Create arrays for the current board of the engine.
+
+        Parameters:
+            - eng - the engine.Engine object
+        """
+        self.engine = eng
+        self.board = eng.board
+        width = self.board.width
+        height = self.board.height
+        # Buffers of arrays which are not kept by the engine
+        self.piece_buf = bytearray(width*height)
+        self.next_buf = bytearray(len(eng.block_data))
+        self.feature_buf = array.array("f",[0.0]*len(FEATURES))
+        self.counter_buf = array.array("q",[0]*len(COUNTERS))
+        # Indexes of cells set in the piece mask and the index of the set next block
+        self.piece_idx = []
+        self.next_idx = None
+        self.arrays = {
+            "board"    : get_view(self.board.cells,(height,width)),
+            "piece"    : get_view(self.piece_buf,(height,width)),
+            "next"     : get_view(self.next_buf,(len(self.next_buf),)),
+            "features" : get_view(self.feature_buf,(len(FEATURES),)),
+            "counters" : get_view(self.counter_buf,(len(COUNTERS),)),
+        }
+
+    def update(self):
+        """
+        Update the piece mask, the next block, features and counters from the engine and
+        return the dictionary with arrays.
+        """
+        eng = self.engine
+        brd = self.board
+        # Cells of the previous position are removed from the mask
+        for i in self.piece_idx:
+            self.piece_buf[i] = 0
+        self.piece_idx = []
+        if eng.active_block is not None:
+            for x,y in eng.get_cells(eng.active_block):
+                if brd.is_inside(x,y):
+                    self.piece_idx.append(y*brd.width+x)
+                    self.piece_buf[y*brd.width+x] = 1
+        if self.next_idx != eng.next_kind:
+            if self.next_idx is not None:
+                self.next_buf[self.next_idx] = 0
+            if eng.next_kind is not None:
+                self.next_buf[eng.next_kind] = 1
+            self.next_idx = eng.next_kind
+        features = self.feature_buf
+        features[0] = eng.speed
+        features[1] = eng.game_over
+        counters = self.counter_buf
+        counters[0] = eng.score
+        counters[1] = eng.lines
+        counters[2] = eng.pieces
+        counters[3] = eng.tick
+        return self.arrays
+
+def fill(engines,boards,pieces=None,nexts=None,features=None,counters=None):
+    """
+    Copy observations of many games into arrays of the caller (e.g., one batch of
+    the training job). The first dimension of arrays is the index of the game, other
+    dimensions are the same as in Observation. Arrays which are None are not filled.
+
+    Parameters:
+        - engines - list of engine.Engine objects with the same board size
+        - boards - (N,height,width) array for boards
+        - pieces - (N,height,width) array for masks of active blocks
+        - nexts - (N,block types) array for one-hot next blocks
+        - features - (N,len(FEATURES)) array for features
+        - counters - (N,len(COUNTERS)) array for counters (use int64, other types can
+                     lose the precision of large values)
+    """
+    for i,eng in enumerate(engines):
+        obs = eng.observe()
+        boards[i] = obs["board"]
+        if pieces is not None:
+            pieces[i] = obs["piece"]
+        if nexts is not None:
+            nexts[i] = obs["next"]
+        if features is not None:
+            features[i] = obs["features"]
+        if counters is not None:
+            counters[i] = obs["counters"]
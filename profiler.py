@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# File: profiler.py
+# Description: Per-frame timing of game phases.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import csv
+import json
+import time
+
+class FrameProfiler(object):
+    """
+    The class which measures the time spent in phases of each frame. Phases are
+    methods of the game object which are replaced by timed wrappers (see instrument),
+    so the game doesn't pay anything when the profiler is not used. Times are kept
+    in ring buffers with the last N frames (in nanoseconds of the monotonic clock).
+
+    Phases can be nested (e.g., the collision check is called by the game logic), the
+    time of the phase includes the time of nested phases.
+
+    The profiler also keeps input latencies (the time from taking the input event from the
+    event queue to the display update of the frame with its result).
+    """
+
+    def __init__(self,phases,size):
+        """
+        Initialize the profiler.
+
+        Parameters:
+            - phases - list of phase names
+            - size - number of frames kept in ring buffers
+        """
+        self.phases = list(phases)
+        self.size = size
+        self.clock = time.perf_counter_ns
+        # Ring buffers - the frame time and the time of each phase
+        self.frame_buf = array.array("q",[0])*size
+        self.phase_buf = [array.array("q",[0])*size for phase in self.phases]
+        # Time of phases in the current frame, the start of the frame, the position in
+        # ring buffers and the number of finished frames
+        self.current = [0]*len(self.phases)
+        self.frame_start = 0
+        self.pos = 0
+        self.frames = 0
+        # Ring buffer of input latencies and the number of measured inputs
+        self.latency_buf = array.array("q",[0])*size
+        self.inputs = 0
+
+    def instrument(self,obj,name,phase):
+        """
+        Replace the method of the object by the wrapper which adds its time to the phase.
+
+        Parameters:
+            - obj - object with the method
+            - name - name of the method
+            - phase - name of the phase
+        """
+        func = getattr(obj,name)
+        idx = self.phases.index(phase)
+        current = self.current
+        clock = self.clock
+
+        def wrapper(*args,**kwargs):
+            start = clock()
+            try:
+                return func(*args,**kwargs)
+            finally:
+                current[idx] += clock() - start
+
+        setattr(obj,name,wrapper)
+
+    def begin_frame(self):
+        """
+        Start the measurement of the new frame.
+        """
+        for i in range(len(self.current)):
+            self.current[i] = 0
+        self.frame_start = self.clock()
+
+    def end_frame(self):
+        """
+        Store times of the finished frame to ring buffers.
+        """
+        pos = self.pos
+        self.frame_buf[pos] = self.clock() - self.frame_start
+        for buf,value in zip(self.phase_buf,self.current):
+            buf[pos] = value
+        self.pos = (pos + 1) % self.size
+        self.frames += 1
+
+    def add_latency(self,value):
+        """
+        Store the input latency.
+
+        Parameters:
+            - value - the latency (ns)
+        """
+        self.latency_buf[self.inputs % self.size] = value
+        self.inputs += 1
+
+    def get_latencies(self):
+        """
+        Returns the list of stored input latencies from the oldest one.
+        """
+        cnt = min(self.inputs,self.size)
+        return [self.latency_buf[(self.inputs - cnt + i) % self.size] for i in range(cnt)]
+
+    def get_frames(self):
+        """
+        Returns the list of stored frames from the oldest one. Each frame is the tuple
+        (frame number,frame time,phase times...).
+        """
+        cnt = min(self.frames,self.size)
+        res = []
+        for i in range(cnt):
+            pos = (self.pos - cnt + i) % self.size
+            res.append(tuple([self.frames - cnt + i,self.frame_buf[pos]] + [buf[pos] for buf in self.phase_buf]))
+        return res
+
+    def get_percentile(self,values,percent):
+        """
+        Returns the percentile of values (nearest rank, 0 for the empty list).
+
+        Parameters:
+            - values - list of values
+            - percent - the percentile (0-100)
+        """
+        if not values:
+            return 0
+        values = sorted(values)
+        return values[min(len(values)-1,int(len(values)*percent/100.0))]
+
+    def get_stats(self,values):
+        """
+        Returns the dictionary with the mean, p50 and p99 of times (in ms).
+
+        Parameters:
+            - values - list of times (ns)
+        """
+        return {
+            "mean" : sum(values)/len(values)/1e6 if values else 0.0,
+            "p50"  : self.get_percentile(values,50)/1e6,
+            "p99"  : self.get_percentile(values,99)/1e6,
+        }
+
+    def get_summary(self):
+        """
+        Returns the dictionary with the mean, p50 and p99 times (ms) of frames, of all
+        phases in stored frames and of stored input latencies.
+        """
+        frames = self.get_frames()
+        res = {}
+        for i,name in enumerate(["frame"] + self.phases):
+            res[name] = self.get_stats([frame[i+1] for frame in frames])
+        res["input_latency"] = self.get_stats(self.get_latencies())
+        return res
+
+    def dump(self,path):
+        """
+        Write stored frames to the file. The CSV file is written if the path ends
+        with .csv, the JSON file (with the summary and input latencies) is written
+        otherwise. Times are in nanoseconds.
+
+        Parameters:
+            - path - path of the file
+        """
+        header = ["frame","frame_ns"] + [phase + "_ns" for phase in self.phases]
+        frames = self.get_frames()
+        if path.endswith(".csv"):
+            with open(path,"w",newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(frames)
+            return
+        with open(path,"w") as f:
+            json.dump({
+                "summary" : self.get_summary(),
+                "frames"  : [dict(zip(header,frame)) for frame in frames],
+                "input_latency_ns" : self.get_latencies(),
+            },f,indent=1)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+# File: replay.py
+# Description: Recording and replaying of games.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The game is given by the board size, the seed of the block generator and by
+# the list of (tick,action) pairs where the tick is the number of the game logic
+# step. The log format is:
+#
+#   - header - magic "TTRP", version (1 byte), width, height (2 bytes each) and
+#              the signed seed (8 bytes), all numbers are little endian
+#   - entries - one varint (LEB128) per action. The value is (tick_diff << 3) | action
+#               where the tick_diff is the difference from the previous entry.
+#               The last entry has the LOG_END action and its tick is the number
+#               of ticks of the whole game.
+
+import argparse
+import struct
+import time
+
+import constants
+import engine
+
+LOG_MAGIC   = b"TTRP"
+LOG_VERSION = 2
+LOG_HEADER  = struct.Struct("<4sBHHq")
+# Action of the last entry
+LOG_END     = 7
+
+class Recorder(object):
+    """
+    Class for writing of the game log.
+    """
+
+    def __init__(self,path,width,height,seed):
+        """
+        Create the log file and write the header.
+
+        Parameters:
+            - path - path of the log file
+            - width - number of cells in one line
+            - height - number of lines
+            - seed - seed of the block generator
+        """
+        self.out = open(path,"wb")
+        self.out.write(LOG_HEADER.pack(LOG_MAGIC,LOG_VERSION,width,height,seed))
+        self.last_tick = 0
+
+    def write(self,tick,action):
+        """
+        Write the action done in the given tick.
+
+        Parameters:
+            - tick - number of the game logic step
+            - action - one of engine.ACTION_* values
+        """
+        value = ((tick - self.last_tick) << 3) | action
+        self.last_tick = tick
+        data = bytearray()
+        while value > 0x7f:
+            data.append((value & 0x7f) | 0x80)
+            value >>= 7
+        data.append(value)
+        self.out.write(data)
+
+    def close(self,tick):
+        """
+        Write the end of the game and close the file.
+
+        Parameters:
+            - tick - number of ticks of the whole game
+        """
+        self.write(tick,LOG_END)
+        self.out.close()
+
+def read_log(path):
+    """
+    Read the game log. Returns the tuple (width,height,seed,ticks,actions) where
+    the ticks is the number of ticks of the game and actions is the dictionary
+    with the list of actions for each tick with some action.
+
+    Parameters:
+        - path - path of the log file
+    """
+    with open(path,"rb") as f:
+        data = f.read()
+    magic,version,width,height,seed = LOG_HEADER.unpack_from(data)
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        raise ValueError("{0} is not the game log".format(path))
+    actions = {}
+    tick = 0
+    ticks = None
+    value = 0
+    shift = 0
+    for byte in data[LOG_HEADER.size:]:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte & 0x80:
+            continue
+        tick += value >> 3
+        action = value & 0x7
+        value = 0
+        shift = 0
+        if action == LOG_END:
+            ticks = tick
+            break
+        actions.setdefault(tick,[]).append(action)
+    if ticks is None:
+        # The game wasn't finished (e.g., the crash), replay all recorded ticks
+        ticks = tick + 1
+    return width,height,seed,ticks,actions
+
+def replay(path,until=None):
+    """
+    Replay the game from the log without the display. Returns the engine.Engine
+    object with the game state.
+
+    Parameters:
+        - path - path of the log file
+        - until - number of ticks to replay (None means the whole game)
+    """
+    width,height,seed,ticks,actions = read_log(path)
+    if until is not None:
+        ticks = min(ticks,until)
+    eng = engine.Engine(width,height,seed=seed)
+    eng.reset()
+    no_actions = []
+    for tick in range(ticks):
+        eng.step_actions(actions.get(tick,no_actions))
+        if eng.game_over:
+            break
+    return eng
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the recorded tetris game.")
+    parser.add_argument("log",help="game log (see the --record option of tetris.py)")
+    parser.add_argument("--tick",type=int,default=None,help="replay the game till the given tick")
+    parser.add_argument("--show",action="store_true",help="show the game after the replay and continue with it")
+    parser.add_argument("--view",default=None,metavar="WxH",help="show the game in the large board mode with the given viewport size in cells")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    eng = replay(args.log,args.tick)
+    elapsed = time.perf_counter() - start
+    print("Tick: {0}, score: {1}, lines: {2}, pieces: {3}, speed: {4}x, game over: {5}".format(
+        eng.tick,eng.score,eng.lines,eng.pieces,eng.speed,eng.game_over))
+    print("Replayed {0} ticks in {1:.3f} s ({2:.0f} ticks/sec)".format(eng.tick,elapsed,eng.tick/max(elapsed,1e-9)))
+    if args.show:
+        # The drawn game in the normal mode has the number of lines lower by two and the
+        # number of blocks in line is even (see Tetris.__init__). Boards with the odd width
+        # and boards larger than the default viewport are shown in the large board mode.
+        import tetris
+        view = tuple([int(v) for v in args.view.split("x")]) if args.view else None
+        if view is None and (eng.blocks_in_line % 2 or eng.blocks_in_line > constants.VIEW_SIZE[0] or
+                             eng.blocks_in_pile > constants.VIEW_SIZE[1]):
+            view = constants.VIEW_SIZE
+        if view is None:
+            game = tetris.Tetris(eng.blocks_in_line,eng.blocks_in_pile+2)
+        else:
+            game = tetris.Tetris(eng.blocks_in_line,eng.blocks_in_pile,view=view)
+        game.copy_from(eng)
+        game.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+# File: server.py
+# Description: Game server hosting many headless tetris sessions.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Each TCP connection plays one game. The client sends one byte per action
+# (engine.ACTION_* values), the server sends binary messages (little endian):
+#
+#   - hello - MSG_HELLO type (1 byte), width, height (2 bytes each) and the signed
+#             seed (8 bytes). It is sent once after the connection.
+#   - update - MSG_UPDATE type (1 byte), tick, score, lines (4 bytes each), game over
+#              flag (1 byte), X, Y of the active block in cells (2 bytes each), type
+#              and rotation of the block (1 byte each), number of changed cells N
+#              (2 bytes) followed by N (cell index (4 bytes), value (1 byte)) pairs.
+#              Only cells changed since the previous update are sent.
+#
+# The connection is closed by the server after the update with the game over flag.
+# The gravity of all games is driven by one timer wheel.
+
+import argparse
+import asyncio
+import random
+import struct
+import time
+
+import constants
+import engine
+import timerwheel
+
+MSG_HELLO  = 1
+MSG_UPDATE = 2
+HELLO      = struct.Struct("<BHHq")
+UPDATE     = struct.Struct("<BIIIBhhBBH")
+CELL       = struct.Struct("<IB")
+
+class Session(object):
+    """
+    One game of the server.
+    """
+
+    def __init__(self,server,writer,seed):
+        """
+        Start the new game.
+
+        Parameters:
+            - server - the Server object
+            - writer - asyncio.StreamWriter of the connection
+            - seed - seed of the block generator
+        """
+        self.server = server
+        self.writer = writer
+        self.engine = engine.Engine(server.width,server.height,seed=seed)
+        self.engine.reset()
+        # Board cells known by the client
+        self.sent = bytearray(len(self.engine.board.cells))
+        # Time of the next gravity move and its timer
+        self.next_move = 0
+        self.timer = None
+        self.send(HELLO.pack(MSG_HELLO,server.width,server.height,seed))
+        self.send_update()
+
+    def send(self,data):
+        """
+        Send the message to the client. The client which doesn't read messages
+        is disconnected.
+
+        Parameters:
+            - data - bytes to send
+        """
+        if self.writer.transport.get_write_buffer_size() > constants.SERVER_WRITE_LIMIT:
+            self.close()
+            return
+        self.writer.write(data)
+
+    def get_diff(self):
+        """
+        Returns the list of (index,value) cells changed since the last call. Only
+        changed lines are compared cell by cell.
+        """
+        cells = self.engine.board.cells
+        sent = self.sent
+        if cells == sent:
+            return []
+        width = self.engine.board.width
+        diff = []
+        for start in range(0,len(cells),width):
+            end = start + width
+            if cells[start:end] != sent[start:end]:
+                for i in range(start,end):
+                    if cells[i] != sent[i]:
+                        diff.append((i,cells[i]))
+        sent[:] = cells
+        return diff
+
+    def send_update(self):
+        """
+        Send the state of the game and changed cells to the client.
+        """
+        eng = self.engine
+        blk = eng.active_block
+        diff = self.get_diff()
+        data = [UPDATE.pack(MSG_UPDATE,eng.tick,eng.score,eng.lines,eng.game_over,
+                            (blk.x - eng.board_x)//constants.BWIDTH,(blk.y - eng.board_y)//constants.BHEIGHT,
+                            blk.kind,blk.rotation,len(diff))]
+        data.extend([CELL.pack(i,value) for i,value in diff])
+        self.send(b"".join(data))
+        self.server.updates += 1
+
+    def do_action(self,action):
+        """
+        Run one step of the game with the action and send the update.
+
+        Parameters:
+            - action - one of engine.ACTION_* values
+        """
+        if self.writer is None:
+            return
+        self.engine.step(action)
+        self.server.steps += 1
+        self.send_update()
+        if self.engine.game_over:
+            self.close()
+
+    def gravity(self):
+        """
+        Move the block down and schedule the next move (the time between moves
+        is given by the game speed).
+        """
+        self.timer = None
+        self.do_action(engine.ACTION_DOWN)
+        if self.writer is not None:
+            self.next_move += self.engine.get_move_tick()
+            self.timer = self.server.wheel.schedule(self,self.next_move)
+
+    def close(self):
+        """
+        End the session and close the connection.
+        """
+        if self.writer is None:
+            return
+        if self.timer is not None:
+            self.server.wheel.cancel(self.timer)
+            self.timer = None
+        self.writer.close()
+        self.writer = None
+        self.server.sessions.discard(self)
+        if self.server.history is not None:
+            self.server.history[self.engine.seed] = self
+
+class Server(object):
+    """
+    The server with many game sessions. Gravity moves of all sessions are
+    scheduled in one timer wheel which is advanced by one task.
+    """
+
+    def __init__(self,width,height,seed=0):
+        """
+        Initialize the server.
+
+        Parameters:
+            - width - number of cells in one line
+            - height - number of lines
+            - seed - seed of the first game, the game i uses the seed+i
+        """
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.games = 0
+        self.sessions = set()
+        self.wheel = None
+        self.wheel_task = None
+        # Finished sessions by their seed (None means to not keep them)
+        self.history = None
+        # Statistics - number of game steps and sent updates
+        self.steps = 0
+        self.updates = 0
+
+    def now(self):
+        """
+        Returns the time of the event loop in ms.
+        """
+        return asyncio.get_running_loop().time() * 1000.0
+
+    async def run_wheel(self):
+        """
+        Advance the timer wheel and run expired gravity moves.
+        """
+        while True:
+            for session in self.wheel.advance(self.now()):
+                session.gravity()
+            await asyncio.sleep(constants.WHEEL_RESOLUTION / 1000.0)
+
+    async def handle(self,reader,writer):
+        """
+        Play one game with the connected client.
+
+        Parameters:
+            - reader,writer - streams of the connection
+        """
+        session = Session(self,writer,self.seed+self.games)
+        self.games += 1
+        self.sessions.add(session)
+        session.next_move = self.now() + session.engine.get_move_tick()
+        session.timer = self.wheel.schedule(session,session.next_move)
+        try:
+            while session.writer is not None:
+                data = await reader.read(constants.SERVER_READ_SIZE)
+                if not data:
+                    break
+                for action in data:
+                    if action <= engine.ACTION_DROP:
+                        session.do_action(action)
+        except ConnectionError:
+            pass
+        finally:
+            session.close()
+
+    async def start(self,host,port):
+        """
+        Start the timer wheel and listen for connections. Returns the asyncio.Server object.
+
+        Parameters:
+            - host,port - address to listen on
+        """
+        self.wheel = timerwheel.TimerWheel(constants.WHEEL_RESOLUTION,constants.WHEEL_SIZE,self.now())
+        self.wheel_task = asyncio.get_running_loop().create_task(self.run_wheel())
+        return await asyncio.start_server(self.handle,host,port,limit=constants.SERVER_READ_SIZE)
+
+class Client(object):
+    """
+    Local test client. It sends random actions and keeps the copy of the
+    board from received updates.
+    """
+
+    def __init__(self,seed,interval):
+        """
+        Initialize the client.
+
+        Parameters:
+            - seed - seed of random actions
+            - interval - time between two actions (ms)
+        """
+        self.random = random.Random(seed)
+        self.interval = interval
+        self.cells = None
+        self.seed = None
+        self.tick = 0
+        self.score = 0
+        self.game_over = False
+        self.updates = 0
+
+    async def read_updates(self,reader):
+        """
+        Read messages till the connection is closed and apply changed cells.
+
+        Parameters:
+            - reader - stream of the connection
+        """
+        msg,width,height,self.seed = HELLO.unpack(await reader.readexactly(HELLO.size))
+        self.cells = bytearray(width*height)
+        while True:
+            try:
+                data = await reader.readexactly(UPDATE.size)
+            except (asyncio.IncompleteReadError,ConnectionError):
+                return
+            msg,self.tick,self.score,lines,self.game_over,x,y,kind,rotation,cnt = UPDATE.unpack(data)
+            data = await reader.readexactly(cnt*CELL.size)
+            for i,value in CELL.iter_unpack(data):
+                self.cells[i] = value
+            self.updates += 1
+
+    async def play(self,host,port,duration):
+        """
+        Connect to the server and play the game for the given time.
+
+        Parameters:
+            - host,port - address of the server
+            - duration - maximal time of the game (s)
+        """
+        reader,writer = await asyncio.open_connection(host,port)
+        task = asyncio.get_running_loop().create_task(self.read_updates(reader))
+        end = time.monotonic() + duration
+        actions = (engine.ACTION_NONE,engine.ACTION_LEFT,engine.ACTION_RIGHT,engine.ACTION_ROTATE,engine.ACTION_DOWN)
+        # The first action is delayed randomly, so clients don't send actions at once
+        await asyncio.sleep(self.random.random() * self.interval / 1000.0)
+        while not task.done() and time.monotonic() < end:
+            try:
+                writer.write(bytes([self.random.choice(actions)]))
+            except ConnectionError:
+                break
+            await asyncio.sleep(self.interval / 1000.0)
+        # Stop sending and wait till all updates are received
+        writer.write_eof()
+        await task
+        writer.close()
+
+async def run_clients(server,host,port,clients,interval,duration):
+    """
+    Start the server and play games of local clients. Prints statistics and
+    checks boards of clients against boards of sessions.
+
+    Parameters:
+        - server - the Server object
+        - host,port - address to listen on
+        - clients - number of clients
+        - interval - time between two actions of the client (ms)
+        - duration - time of the test (s)
+    """
+    srv = await server.start(host,port)
+    port = srv.sockets[0].getsockname()[1]
+    # Remember sessions to compare their boards with clients
+    server.history = {}
+    players = [Client(i,interval) for i in range(clients)]
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*[player.play(host,port,duration) for player in players])
+    elapsed = time.perf_counter() - start
+    cpu_time = time.process_time() - cpu_start
+    srv.close()
+    await srv.wait_closed()
+    diff = 0
+    for player in players:
+        session = server.history.get(player.seed)
+        if session is None or player.cells != session.engine.board.cells or player.tick != session.engine.tick:
+            diff += 1
+    print("{0} sessions, {1} steps ({2:.0f} per second), {3} updates, CPU time {4:.1f} % of {5:.1f} s".format(
+        clients,server.steps,server.steps/elapsed,server.updates,100.0*cpu_time/elapsed,elapsed))
+    print("different boards: {0}".format(diff))
+
+def main():
+    parser = argparse.ArgumentParser(description="Server with many tetris games.")
+    parser.add_argument("--host",default="127.0.0.1",help="address to listen on")
+    parser.add_argument("--port",type=int,default=constants.SERVER_PORT,help="port to listen on (0 means any free port)")
+    parser.add_argument("--width",type=int,default=16,help="number of cells in one line")
+    parser.add_argument("--height",type=int,default=28,help="number of lines")
+    parser.add_argument("--seed",type=int,default=0,help="seed of the first game")
+    parser.add_argument("--clients",type=int,default=0,help="test the server with the given number of local clients")
+    parser.add_argument("--interval",type=int,default=200,help="time between actions of local clients (ms)")
+    parser.add_argument("--duration",type=float,default=10.0,help="time of the test with local clients (s)")
+    args = parser.parse_args()
+
+    server = Server(args.width,args.height,args.seed)
+    if args.clients:
+        asyncio.run(run_clients(server,args.host,args.port,args.clients,args.interval,args.duration))
+        return
+
+    async def serve():
+        srv = await server.start(args.host,args.port)
+        async with srv:
+            await srv.serve_forever()
+
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()
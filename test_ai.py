@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# File: test_ai.py
+# Description: Tests of the automatic player.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import ai
+import engine
+
+class TestSearch(unittest.TestCase):
+
+    def play(self,get_moves,pieces=30):
+        """
+        Play the game and return the list of plans.
+
+        Parameters:
+            - get_moves - function which returns the plan of the engine
+            - pieces - number of played blocks
+        """
+        eng = engine.Engine(10,20,seed=5)
+        eng.reset()
+        plans = []
+        while not eng.game_over and eng.pieces <= pieces:
+            plan = get_moves(eng)
+            plans.append(plan)
+            eng.step_actions(plan)
+        return plans
+
+    def test_continued_search(self):
+        # The search continued by many calls without the budget selects the same placements
+        player = ai.AutoPlayer()
+        calls = []
+
+        def get_moves(eng):
+            moves = player.get_moves(eng,0.0,False)
+            calls.append(1)
+            while not moves:
+                moves = player.get_moves(eng,0.0,False)
+                calls.append(1)
+            return moves
+
+        plans = self.play(get_moves)
+        self.assertEqual(plans,self.play(lambda eng: ai.AutoPlayer().get_plan(eng)))
+        self.assertGreater(len(calls),len(plans))
+
+    def test_final_call(self):
+        # The final call selects the placement evaluated without the next block at least
+        player = ai.AutoPlayer()
+        plain = ai.AutoPlayer(lookahead=False)
+        eng = engine.Engine(10,20,seed=5)
+        eng.reset()
+        self.assertEqual(player.get_moves(eng,0.0,True),plain.get_plan(eng))
+        self.assertFalse(player.is_searching())
+        self.assertEqual(player.cut,1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# File: test_board.py
+# Description: Tests of the occupancy grid.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import unittest
+
+import board
+
+class TestRemoveLines(unittest.TestCase):
+
+    def test_tops(self):
+        # Tops updated by the line removal are the same as tops found by the full search
+        rnd = random.Random(1)
+        for i in range(2000):
+            width = rnd.randint(1,12)
+            height = rnd.randint(1,15)
+            brd = board.Board(width,height)
+            for y in range(height):
+                fill = rnd.random()
+                brd.lock([(x,y) for x in range(width) if rnd.random() < fill],rnd.randint(1,7))
+            for y in rnd.sample(range(height),rnd.randint(0,min(height,4))):
+                brd.lock([(x,y) for x in range(width)],rnd.randint(1,7))
+            brd.remove_lines(brd.get_full_lines(range(height)))
+            tops = list(brd.tops)
+            brd.update_tops()
+            self.assertEqual(tops,brd.tops)
+            self.assertEqual(brd.line_cnt,[width - brd.cells[y*width:(y+1)*width].count(0) for y in range(height)])
+
+if __name__ == "__main__":
+    unittest.main()
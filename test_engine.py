@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# File: test_engine.py
+# Description: Tests of the headless engine.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import engine
+
+# Actions of played games (the drop makes many blocks in few steps)
+ACTIONS = (engine.ACTION_DROP,engine.ACTION_LEFT,engine.ACTION_ROTATE,engine.ACTION_RIGHT,engine.ACTION_DOWN)
+
+def play(eng,steps):
+    """
+    Play the game and return the list of states after each step.
+
+    Parameters:
+        - eng - the engine.Engine object
+        - steps - number of steps
+    """
+    return [eng.step(ACTIONS[i % len(ACTIONS)]) for i in range(steps)]
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = engine.Engine(10,20,seed=11)
+        self.eng.reset()
+        play(self.eng,7)
+
+    def test_restore_same_engine(self):
+        # The game continues in the same way after each restore, blocks are generated after
+        # the snapshot (the generator has moved past it) before the next restore
+        data = self.eng.snapshot()
+        state = self.eng.state()
+        pieces = self.eng.pieces
+        first = play(self.eng,40)
+        self.assertGreater(self.eng.pieces,pieces)
+        for i in range(3):
+            self.eng.restore(data)
+            self.assertEqual(self.eng.state(),state)
+            self.assertEqual(play(self.eng,40),first)
+
+    def test_restore_other_engine(self):
+        # The engine reused for many snapshots continues in the same way as the original one
+        other = engine.Engine(10,20)
+        other.reset()
+        data = self.eng.snapshot()
+        first = play(self.eng,40)
+        for i in range(2):
+            other.restore(data)
+            self.assertEqual(play(other,40),first)
+        later = self.eng.snapshot()
+        second = play(self.eng,40)
+        other.restore(later)
+        self.assertEqual(play(other,40),second)
+
+    def test_snapshot_after_restore(self):
+        # The snapshot of the restored game is the same as the restored one
+        data = self.eng.snapshot()
+        play(self.eng,40)
+        self.eng.restore(data)
+        self.assertEqual(self.eng.snapshot(),data)
+
+    def test_copy_from(self):
+        other = engine.Engine(10,20)
+        other.copy_from(self.eng)
+        self.assertEqual(other.state(),self.eng.state())
+        self.assertEqual(play(other,40),play(self.eng,40))
+
+    def test_invalid_snapshot(self):
+        data = self.eng.snapshot()
+        with self.assertRaises(ValueError):
+            engine.Engine(12,20).restore(data)
+        with self.assertRaises(ValueError):
+            self.eng.restore(b"XXXX" + data[4:])
+
+class TestObservation(unittest.TestCase):
+
+    def test_large_counters(self):
+        # Values above 2^24 are not rounded (float32 would round them)
+        eng = engine.Engine(10,20,seed=11)
+        eng.reset()
+        play(eng,7)
+        eng.score = 2**24 + 1
+        eng.tick = 2**40 + 3
+        counters = eng.observe()["counters"]
+        self.assertEqual(int(counters[0]),2**24 + 1)
+        self.assertEqual(int(counters[3]),2**40 + 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# File: test_tetris.py
+# Description: Tests of the drawn game (the screen is drawn by the dummy video driver).
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import unittest
+
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+import pygame
+
+import tetris
+
+class SteppedTetris(tetris.Tetris):
+    """
+    The game with the game time moved by the test (frames don't depend on the real time).
+    """
+
+    def get_game_time(self):
+        return self.test_time
+
+class TestDirtyDraw(unittest.TestCase):
+
+    def run_frames(self,game,frames,frame_time):
+        """
+        Run frames of the game and compare the dirty drawn screen with the full redraw
+        after each frame. Returns the number of checked frames.
+
+        Parameters:
+            - game - the SteppedTetris object
+            - frames - maximal number of frames
+            - frame_time - game time of one frame (ms)
+        """
+        game.init_display()
+        game.done = False
+        game.test_time = 0.0
+        game.set_move_timer()
+        cnt = 0
+        try:
+            while cnt < frames and not game.game_over:
+                game.test_time += frame_time
+                game.simulate()
+                game.draw_game()
+                dirty = pygame.image.tobytes(game.screen,"RGB")
+                game.full_redraw = True
+                game.draw_game()
+                self.assertTrue(dirty == pygame.image.tobytes(game.screen,"RGB"),"frame {0} differs".format(cnt))
+                cnt += 1
+        finally:
+            pygame.display.quit()
+        return cnt
+
+    def test_one_step_per_frame(self):
+        game = SteppedTetris(16,30,seed=3,auto=True)
+        self.assertGreater(self.run_frames(game,200,game.get_move_tick()),50)
+
+    def test_many_steps_per_frame(self):
+        # More blocks are locked in one frame
+        game = SteppedTetris(16,30,seed=3,auto=True)
+        self.assertGreater(self.run_frames(game,60,50*game.get_move_tick()),20)
+
+class TestTurbo(unittest.TestCase):
+
+    def test_invalid_turbo(self):
+        for turbo in (0,-1.0,float("nan"),float("inf")):
+            with self.assertRaises(ValueError):
+                tetris.Tetris(16,30,turbo=turbo)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,90 +17,294 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+# Start of the program (see the --startup option)
+START_TIME = time.perf_counter()
+
 import pygame
-import pdb
 
-import random
+import argparse
 import math
+import random
 import block
+import engine
 import constants
+import textcache
 
-class Tetris(object):
+# End of module imports (modules of optional features are imported when they are used)
+IMPORT_TIME = time.perf_counter()
+
+# Actions of control keys - (action,the action is repeated while the key is held)
+KEY_ACTIONS = {
+    pygame.K_DOWN  : (engine.ACTION_DOWN,True),
+    pygame.K_LEFT  : (engine.ACTION_LEFT,True),
+    pygame.K_RIGHT : (engine.ACTION_RIGHT,True),
+    pygame.K_SPACE : (engine.ACTION_ROTATE,False),
+    pygame.K_UP    : (engine.ACTION_DROP,False),
+}
+
+class Tetris(engine.Engine):
     """
-    The class with implementation of tetris game logic.
+    The class with implementation of tetris game. Game rules are implemented
+    by the engine, this class adds the drawing and the control from the pygame
+    event queue.
     """
 
-    def __init__(self,bx,by):
+    def __init__(self,bx,by,dirty_draw=True,max_fps=constants.MAX_FPS,seed=None,record=None,auto=False,profile=False,trace=None,view=None,
+                 startup=False,turbo=1.0):
         """
         Initialize the tetris object.
 
         Parameters:
             - bx - number of blocks in x
             - by - number of blocks in y
+            - dirty_draw - redraw only changed parts of the screen (the whole screen
+                           is redrawn in every frame if disabled)
+            - max_fps - maximal number of frames per second (0 means no limit)
+            - seed - seed of the block generator (None means random seed)
+            - record - path of the file for the game log (None means no recording), see replay.py
+            - auto - the game is played by the automatic player (see ai.py)
+            - profile - measure times of game phases and show them below the board
+            - trace - path of the CSV or JSON file with measured times (written on exit,
+                      it enables the profile)
+            - view - (width,height) of the viewport in cells. The large board mode is used, the
+                     board has bx x by cells and only the part around the active block is drawn.
+            - startup - print times of the program start and quit after the first frame
+            - turbo - speed of the game time (e.g., 10 runs the game 10 times faster), held
+                      keys are repeated in the real time. It has to be a positive finite number.
         """
-        # Compute the resolution of the play board based on the required number of blocks.
-        self.resx = bx*constants.BWIDTH+2*constants.BOARD_HEIGHT+constants.BOARD_MARGIN
-        self.resy = by*constants.BHEIGHT+2*constants.BOARD_HEIGHT+constants.BOARD_MARGIN
+        if not (turbo > 0 and math.isfinite(turbo)):
+            raise ValueError("The turbo ratio has to be a positive finite number")
+        # Compute the resolution of the play board based on the required number of blocks. The
+        # window of the large board has the size of the viewport.
+        self.view = view
+        if view is None:
+            self.resx = bx*constants.BWIDTH+2*constants.BOARD_HEIGHT+constants.BOARD_MARGIN
+            self.resy = by*constants.BHEIGHT+2*constants.BOARD_HEIGHT+constants.BOARD_MARGIN
+        else:
+            self.view_rect = pygame.Rect(constants.BOARD_HEIGHT+constants.BOARD_MARGIN,
+                                         constants.BOARD_UP_MARGIN+constants.BOARD_HEIGHT+constants.BOARD_MARGIN,
+                                         min(view[0],bx)*constants.BWIDTH,min(view[1],by)*constants.BHEIGHT)
+            self.resx = self.view_rect.right+constants.BOARD_MARGIN+constants.BOARD_HEIGHT
+            self.resy = self.view_rect.bottom+constants.BOARD_MARGIN+constants.BOARD_HEIGHT
         # Prepare the pygame board objects (white lines)
         self.board_up    = pygame.Rect(0,constants.BOARD_UP_MARGIN,self.resx,constants.BOARD_HEIGHT)
         self.board_down  = pygame.Rect(0,self.resy-constants.BOARD_HEIGHT,self.resx,constants.BOARD_HEIGHT)
         self.board_left  = pygame.Rect(0,constants.BOARD_UP_MARGIN,constants.BOARD_HEIGHT,self.resy)
         self.board_right = pygame.Rect(self.resx-constants.BOARD_HEIGHT,constants.BOARD_UP_MARGIN,constants.BOARD_HEIGHT,self.resy)
-        # List of used blocks
-        self.blk_list    = []
         # Compute start indexes for tetris blocks
-        self.start_x = math.ceil(self.resx/2.0)
-        self.start_y = constants.BOARD_UP_MARGIN + constants.BOARD_HEIGHT + constants.BOARD_MARGIN
-        # Blocka data (shapes and colors). The shape is encoded in the list of [X,Y] points. Each point
-        # represents the relative position. The true/false value is used for the configuration of rotation where
-        # False means no rotate and True allows the rotation.
-        self.block_data = (
-            ([[0,0],[1,0],[2,0],[3,0]],constants.RED,True),     # I block 
-            ([[0,0],[1,0],[0,1],[-1,1]],constants.GREEN,True),  # S block 
-            ([[0,0],[1,0],[2,0],[2,1]],constants.BLUE,True),    # J block
-            ([[0,0],[0,1],[1,0],[1,1]],constants.ORANGE,False), # O block
-            ([[-1,0],[0,0],[0,1],[1,1]],constants.GOLD,True),   # Z block
-            ([[0,0],[1,0],[2,0],[1,1]],constants.PURPLE,True),  # T block
-            ([[0,0],[1,0],[2,0],[0,1]],constants.CYAN,True),    # J block
-        )
+        start_x = math.ceil(self.resx/2.0)
+        start_y = constants.BOARD_UP_MARGIN + constants.BOARD_HEIGHT + constants.BOARD_MARGIN
         # Compute the number of blocks. When the number of blocks is even, we can use it directly but 
         # we have to decrese the number of blocks in line by one when the number is odd (because of the used margin).
-        self.blocks_in_line = bx if bx%2 == 0 else bx-1
-        self.blocks_in_pile = by
-        # Score settings
-        self.score = 0
-        # Remember the current speed 
-        self.speed = 1
-        # The score level threshold
-        self.score_level = constants.SCORE_LEVEL
-
-    def apply_action(self):
-        """
-        Get the event from the event queue and run the appropriate 
-        action.
-        """
-        # Take the event from the event queue.
-        for ev in pygame.event.get():
+        # The number of lines is given by the space between the start line and the down board.
+        blocks_in_line = bx if bx%2 == 0 else bx-1
+        lines = (self.board_down.y - start_y)//constants.BHEIGHT
+        if view is not None:
+            blocks_in_line = bx
+            lines = by
+        # The recorded game needs the known seed
+        if seed is None and record is not None:
+            seed = random.randrange(1 << 32)
+        engine.Engine.__init__(self,blocks_in_line,lines,seed)
+        # Setup the position of the board on the screen. The first cell column is the leftmost position 
+        # reachable from the start position, the first line is the start line. Blocks of the large
+        # board keep the position of the engine (the board starts on [0,0]), the viewport moves them
+        # on the screen.
+        if view is None:
+            self.start_x = start_x
+            self.start_y = start_y
+            self.board_x = self.start_x - constants.BWIDTH*((self.start_x - self.board_left.right)//constants.BWIDTH)
+            self.board_y = self.start_y
+        self.dirty_draw = dirty_draw
+        self.max_fps = max_fps
+        self.record = record
+        self.recorder = None
+        self.player = None
+        if auto:
+            import ai
+            self.player = ai.AutoPlayer()
+        self.startup = startup
+        self.turbo = turbo
+        # Rendered strings (the status line is changed only with the score)
+        self.text_cache = textcache.TextCache(constants.TEXT_CACHE_SIZE)
+        # Area of the status line
+        self.status_rect = pygame.Rect(0,0,self.resx,constants.BOARD_UP_MARGIN)
+        # The profiler replaces measured methods by timed wrappers, nothing is measured
+        # without it. Measured times are shown in the area below the board. The collision
+        # phase contains all checks of the block against the board: moves and rotations
+        # (check_placement), the gravity check (can_fall) and drops with the ghost piece
+        # (get_drop_distance, the ghost is also counted in the drawing).
+        self.trace = trace
+        self.profiler = None
+        if profile or trace is not None:
+            import profiler
+            self.profiler = profiler.FrameProfiler(("apply_action","game_logic","collision","detect_line","draw_game","display"),
+                                                   constants.PROFILE_FRAMES)
+            for name,phase in (("get_input","apply_action"),("apply_action","apply_action"),("game_logic","game_logic"),("check_placement","collision"),
+                               ("can_fall","collision"),("get_drop_distance","collision"),("detect_line","detect_line"),("draw_game","draw_game"),("update_display","display")):
+                self.profiler.instrument(self,name,phase)
+            self.profile_rect = pygame.Rect(0,self.resy,self.resx,constants.PROFILE_HEIGHT)
+            self.profile_text = ""
+            self.resy += constants.PROFILE_HEIGHT
+
+    def init_game(self):
+        """
+        Initialize the game state.
+        """
+        engine.Engine.init_game(self)
+        # Chunks of the large board are drawn from the new board
+        self.viewport = None
+        if self.view is not None:
+            import viewport
+            self.viewport = viewport.Viewport(self.board,[data[1] for data in self.block_data],*self.view)
+        # State of the last drawn frame - the whole screen has to be drawn first. After that,
+        # we remember the drawn block with its Rects and the drawn status line. Blocks locked
+        # since the last frame are drawn by the next one (one frame can run many steps).
+        self.full_redraw = True
+        self.drawn_block = None
+        self.locked_blocks = []
+        self.drawn_rects = []
+        self.drawn_status = None
+        # Events taken from the queue by the wait_event function and the time of the wait end
+        self.events = []
+        self.wait_time = 0
+        # Held keys which are repeated - key -> time of the next repeat (ms of pygame.time.get_ticks)
+        self.repeat = {}
+        # Time when the first input of the frame was taken from the queue (ns, only
+        # measured by the profiler), see update_display
+        self.input_time = None
+        # The simulation clock - the game time of the current step, the time of the next
+        # gravity move (ms) and the real time (s) with its game time (see sync_clock)
+        self.game_time = 0.0
+        self.next_move = 0.0
+        self.clock_real = 0.0
+        self.clock_game = 0.0
+
+    def get_input(self):
+        """
+        Get events from the event queue and return the list of actions of control keys.
+        Held keys are repeated by the game (the OS key repeat is not used), the first
+        repeat comes after KEY_REPEAT_DELAY ms and the next ones every KEY_REPEAT_INTERVAL ms.
+        """
+        # Take the event from the event queue (including the event we have waited for).
+        input_time = None
+        if self.profiler is not None:
+            input_time = self.wait_time if self.events else time.perf_counter_ns()
+        events = self.events + pygame.event.get()
+        self.events = []
+        now = pygame.time.get_ticks()
+        actions = []
+        for ev in events:
             # Check if the close button was fired.
             if ev.type == pygame.QUIT or (ev.type == pygame.KEYDOWN and ev.unicode == 'q'):
                 self.done = True
             # Detect the key evevents for game control.
             if ev.type == pygame.KEYDOWN:
-                if ev.key == pygame.K_DOWN:
-                    self.active_block.move(0,constants.BHEIGHT)
-                if ev.key == pygame.K_LEFT:
-                    self.active_block.move(-constants.BWIDTH,0)
-                if ev.key == pygame.K_RIGHT:
-                    self.active_block.move(constants.BWIDTH,0)
-                if ev.key == pygame.K_SPACE:
-                    self.active_block.rotate()
+                if ev.key in KEY_ACTIONS:
+                    action,repeat = KEY_ACTIONS[ev.key]
+                    actions.append(action)
+                    if repeat:
+                        self.repeat[ev.key] = now + constants.KEY_REPEAT_DELAY
+                    if self.input_time is None:
+                        self.input_time = input_time
                 if ev.key == pygame.K_p:
                     self.pause()
-       
-            # Detect if the movement event was fired by the timer.
-            if ev.type == constants.TIMER_MOVE_EVENT:
-                self.active_block.move(0,constants.BHEIGHT)
-       
+            # The released key is not repeated (keys are not released when the window
+            # loses the focus)
+            if ev.type == pygame.KEYUP:
+                self.repeat.pop(ev.key,None)
+            if ev.type == pygame.WINDOWFOCUSLOST:
+                self.repeat.clear()
+        # Repeat held keys (repeats missed by the slow frame are applied at once)
+        for key,when in self.repeat.items():
+            while when <= now:
+                actions.append(KEY_ACTIONS[key][0])
+                when += constants.KEY_REPEAT_INTERVAL
+            self.repeat[key] = when
+        return actions
+
+    def get_player_moves(self,end,final):
+        """
+        Returns actions of the automatic player which move the new block to the selected
+        placement (the empty list if the game is played by the user or if the search
+        is not finished). The search is run till the end of the frame simulation and it
+        is continued in next frames. The placement has to be selected before the block
+        falls, the best placement found so far is used by the final call.
+
+        Parameters:
+            - end - time.perf_counter() value when the frame simulation stops
+            - final - the placement has to be selected (the gravity move is due)
+        """
+        if self.player is None:
+            return []
+        return self.player.get_moves(self,max(0.0,(end - time.perf_counter())*1000.0),final)
+
+    def run_step(self,actions):
+        """
+        Run one step of the game logic with the list of actions. Each action is checked
+        against the board on its own (see engine.Engine.do_action).
+
+        Parameters:
+            - actions - list of engine.ACTION_* values
+        """
+        self.actions = actions
+        self.game_logic()
+        self.actions = []
+
+    def simulate(self):
+        """
+        Run game logic steps of the frame. The step with input actions is run first (frames
+        without actions have no step). After that, gravity moves which are due till the
+        current game time are run as separate steps on their game times, so the sequence
+        of steps doesn't depend on the frame rate (slow frames are followed by more steps).
+        Gravity moves are run for at most SIM_MAX_TIME ms in one frame, the rest is run in
+        next frames (the game time lags behind the real time), so the game still reacts
+        to inputs. Searches of the automatic player are included in this time (see
+        get_player_moves).
+        """
+        end = time.perf_counter() + constants.SIM_MAX_TIME/1000.0
+        self.get_block()
+        actions = self.get_input() + self.get_player_moves(end,False)
+        if actions and not(self.done):
+            self.run_step(actions)
+        now = self.get_game_time()
+        while self.next_move <= now and time.perf_counter() < end and not(self.done) and not(self.game_over):
+            self.game_time = self.next_move
+            self.next_move += self.get_move_tick()
+            # The new block is moved by the automatic player before it falls
+            self.get_block()
+            self.run_step(self.get_player_moves(end,True) + [engine.ACTION_DOWN])
+        if self.next_move > now:
+            self.game_time = now
+        # The next block is shown right after the lock
+        if not(self.game_over):
+            self.get_block()
+
+    def get_game_time(self):
+        """
+        Returns the game time (ms) of the current real time.
+        """
+        return self.clock_game + (time.perf_counter() - self.clock_real)*1000.0*self.turbo
+
+    def sync_clock(self):
+        """
+        Continue the game time from the time of the current step (e.g., after the pause).
+        """
+        self.clock_game = self.game_time
+        self.clock_real = time.perf_counter()
+
+    def do_action(self,action):
+        """
+        Apply the action and write it to the game log.
+
+        Parameters:
+            - action - one of engine.ACTION_* values
+        """
+        if self.recorder is not None:
+            self.recorder.write(self.tick,action)
+        engine.Engine.do_action(self,action)
+
     def pause(self):
         """
         Pause the game and draw the string. This function
@@ -110,42 +314,124 @@ class Tetris(object):
         self.print_center(["PAUSE","Press \"p\" to continue"])
         pygame.display.flip()
         while True:
-            for ev in pygame.event.get():
-                if ev.type == pygame.KEYDOWN and ev.key == pygame.K_p:
-                    return
+            # Sleep till the next event
+            ev = pygame.event.wait()
+            if ev.type == pygame.KEYDOWN and ev.key == pygame.K_p:
+                # The string has to be removed from the screen. Keys released
+                # during the pause are not known, so no key is repeated. The game
+                # time doesn't run during the pause.
+                self.full_redraw = True
+                self.repeat.clear()
+                self.sync_clock()
+                return
+
+    def wait_event(self):
+        """
+        Sleep till the next event (e.g., key press) is received, till the next gravity
+        move or till the next repeat of the held key. Nothing can change on the screen
+        without them, so we don't need to run the game logic and drawing. The game doesn't
+        sleep while the automatic player searches the placement.
+        """
+        if self.player is not None and self.player.is_searching():
+            return
+        # Time till the gravity move in the real time (ms)
+        timeout = (self.next_move - self.get_game_time())/self.turbo
+        if self.repeat:
+            timeout = min(timeout,min(self.repeat.values()) - pygame.time.get_ticks())
+        if timeout <= 0:
+            return
+        ev = pygame.event.wait(math.ceil(timeout))
+        if ev.type == pygame.NOEVENT:
+            return
+        self.events.append(ev)
+        if self.profiler is not None:
+            self.wait_time = time.perf_counter_ns()
        
     def set_move_timer(self):
         """
-        Setup the move timer to the 
+        Schedule the next gravity move after the time given by the game speed. It is
+        called on the start and when the speed is changed.
         """
-        # Setup the time to fire the move event. Minimal allowed value is 1
-        speed = math.floor(constants.MOVE_TICK / self.speed)
-        speed = max(1,speed)
-        pygame.time.set_timer(constants.TIMER_MOVE_EVENT,speed)
+        self.next_move = self.game_time + self.get_move_tick()
  
-    def run(self):
-        # Initialize the game (pygame, fonts)
-        pygame.init()
+    def init_display(self):
+        """
+        Initialize pygame, fonts and the game window. Only used pygame modules are
+        initialized (no sound) and the font bundled with pygame is loaded directly (the list
+        of system fonts is not searched).
+        """
+        pygame.display.init()
         pygame.font.init()
-        self.myfont = pygame.font.SysFont(pygame.font.get_default_font(),constants.FONT_SIZE)
+        self.myfont = pygame.font.Font(None,constants.FONT_SIZE)
         self.screen = pygame.display.set_mode((self.resx,self.resy))
         pygame.display.set_caption("Tetris")
-        # Setup the time to fire the move event every given time
+        # Shape blocks are blitted from tiles in the pixel format of the screen
+        block.init_tiles([data[1] for data in self.block_data])
+        if self.profiler is not None:
+            self.profile_font = pygame.font.Font(None,constants.PROFILE_FONT_SIZE)
+
+    def run(self):
+        # Initialize the game (pygame, fonts)
+        init_start = time.perf_counter()
+        self.init_display()
+        init_end = time.perf_counter()
+        # Start the game time and schedule the first gravity move
+        self.sync_clock()
         self.set_move_timer()
-        # Control variables for the game. The done signal is used 
+        # Control variables of the game are set by the init_game function. The done signal is used 
         # to control the main loop (it is set by the quit action), the game_over signal
         # is set by the game logic and it is also used for the detection of "game over" drawing.
         # Finally the new_block variable is used for the requesting of new tetris block. 
+        # The game can continue from the loaded state (see replay.py).
         self.done = False
-        self.game_over = False
-        self.new_block = True
+        if self.record is not None:
+            import replay
+            self.recorder = replay.Recorder(self.record,self.blocks_in_line,self.blocks_in_pile,self.seed)
         # Print the initial score
         self.print_status_line()
+        # The clock limits the frame rate, the CPU time is measured for the report
+        clock = pygame.time.Clock()
+        frames = 0
+        cpu_start = time.process_time()
         while not(self.done) and not(self.game_over):
-            # Get the block and run the game logic
-            self.get_block()
-            self.game_logic()
+            if self.profiler is not None:
+                self.profiler.begin_frame()
+            # Run game logic steps of the frame and draw the result
+            self.simulate()
             self.draw_game()
+            if self.profiler is not None:
+                self.profiler.end_frame()
+            frames += 1
+            # Report the time to the first frame and quit (see the startup parameter)
+            if self.startup and frames == 1:
+                now = time.perf_counter()
+                print("Startup: imports {0:.1f} ms, game setup {1:.1f} ms, display {2:.1f} ms, first frame {3:.1f} ms".format(
+                    1000.0*(IMPORT_TIME-START_TIME),1000.0*(init_start-IMPORT_TIME),1000.0*(init_end-init_start),1000.0*(now-init_end)))
+                print("Time to first frame: {0:.1f} ms".format(1000.0*(now-START_TIME)))
+                self.done = True
+            # Limit the frame rate and sleep till something happens
+            clock.tick(self.max_fps)
+            if not(self.done) and not(self.game_over):
+                self.wait_event()
+        cpu_time = time.process_time() - cpu_start
+        if self.recorder is not None:
+            self.recorder.close(self.tick)
+            self.recorder = None
+        # The report is printed only if it was requested (the profile or the startup time)
+        if self.profiler is not None or self.startup:
+            print("Frames: {0}, CPU time per frame: {1:.3f} ms".format(frames,1000.0*cpu_time/max(1,frames)))
+            print("Game time: {0:.1f} s, steps: {1}, pieces: {2}".format(self.game_time/1000.0,self.tick,self.pieces))
+            if self.player is not None:
+                print("Evaluated placements per second: {0:.0f}".format(self.player.placements_per_sec()))
+        if self.profiler is not None:
+            for name,value in self.profiler.get_summary().items():
+                print("{0:14s} mean {1:8.3f} ms, p50 {2:8.3f} ms, p99 {3:8.3f} ms".format(name,value["mean"],value["p50"],value["p99"]))
+            if self.max_fps:
+                latencies = self.profiler.get_latencies()
+                slow = len([value for value in latencies if value > 1e9/self.max_fps])
+                print("Inputs: {0}, latency over one frame: {1}".format(len(latencies),slow))
+            if self.trace is not None:
+                self.profiler.dump(self.trace)
         # Display the game_over and wait for a keypress
         if self.game_over:
             self.print_game_over()
@@ -153,11 +439,17 @@ class Tetris(object):
         pygame.font.quit()
         pygame.display.quit()        
    
+    def get_status_line(self):
+        """
+        Returns the string of the current state line
+        """
+        return "SCORE: {0}   SPEED: {1}x".format(self.score,self.speed)
+
     def print_status_line(self):
         """
         Print the current state line
         """
-        string = ["SCORE: {0}   SPEED: {1}x".format(self.score,self.speed)]
+        string = [self.get_status_line()]
         self.print_text(string,constants.POINT_MARGIN,constants.POINT_MARGIN)        
 
     def print_game_over(self):
@@ -168,11 +460,11 @@ class Tetris(object):
         self.print_center(["Game Over","Press \"q\" to exit"])
         # Draw the string
         pygame.display.flip()
-        # Wait untill the space is pressed
+        # Wait untill the q is pressed (sleep till the next event)
         while True: 
-            for ev in pygame.event.get():
-                if ev.type == pygame.QUIT or (ev.type == pygame.KEYDOWN and ev.unicode == 'q'):
-                    return
+            ev = pygame.event.wait()
+            if ev.type == pygame.QUIT or (ev.type == pygame.KEYDOWN and ev.unicode == 'q'):
+                return
 
     def print_text(self,str_lst,x,y):
         """
@@ -185,10 +477,9 @@ class Tetris(object):
         """
         prev_y = 0
         for string in str_lst:
-            size_x,size_y = self.myfont.size(string)
-            txt_surf = self.myfont.render(string,False,(255,255,255))
+            txt_surf = self.text_cache.render(self.myfont,string,constants.WHITE)
             self.screen.blit(txt_surf,(x,y+prev_y))
-            prev_y += size_y 
+            prev_y += txt_surf.get_height()
 
     def print_center(self,str_list):
         """
@@ -197,112 +488,46 @@ class Tetris(object):
         Parameters:
             - str_lst - list of strings to print. Each string is printed on new line.
         """
-        max_xsize = max([tmp[0] for tmp in map(self.myfont.size,str_list)])
+        max_xsize = max([self.text_cache.render(self.myfont,string,constants.WHITE).get_width() for string in str_list])
         self.print_text(str_list,self.resx/2-max_xsize/2,self.resy/2)
 
-    def block_colides(self):
-        """
-        Check if the block colides with any other block.
-
-        The function returns True if the collision is detected.
-        """
-        for blk in self.blk_list:
-            # Check if the block is not the same
-            if blk == self.active_block:
-                continue 
-            # Detect situations
-            if(blk.check_collision(self.active_block.shape)):
-                return True
-        return False
-
-    def game_logic(self):
-        """
-        Implementation of the main game logic. This function detects colisions
-        and insertion of new tetris blocks.
-        """
-        # Remember the current configuration and try to 
-        # apply the action
-        self.active_block.backup()
-        self.apply_action()
-        # Border logic, check if we colide with down border or any
-        # other border. This check also includes the detection with other tetris blocks. 
-        down_board  = self.active_block.check_collision([self.board_down])
-        any_border  = self.active_block.check_collision([self.board_left,self.board_up,self.board_right])
-        block_any   = self.block_colides()
-        # Restore the configuration if any collision was detected
-        if down_board or any_border or block_any:
-            self.active_block.restore()
-        # So far so good, sample the previous state and try to move down (to detect the colision with other block). 
-        # After that, detect the the insertion of new block. The block new block is inserted if we reached the boarder
-        # or we cannot move down.
-        self.active_block.backup()
-        self.active_block.move(0,constants.BHEIGHT)
-        can_move_down = not self.block_colides()  
-        self.active_block.restore()
-        # We end the game if we are on the respawn and we cannot move --> bang!
-        if not can_move_down and (self.start_x == self.active_block.x and self.start_y == self.active_block.y):
-            self.game_over = True
-        # The new block is inserted if we reached down board or we cannot move down.
-        if down_board or not can_move_down:     
-            # Request new block
-            self.new_block = True
-            # Detect the filled line and possibly remove the line from the 
-            # screen.
-            self.detect_line()   
- 
-    def detect_line(self):
-        """
-        Detect if the line is filled. If yes, remove the line and
-        move with remaining bulding blocks to new positions.
-        """
-        # Get each shape block of the non-moving tetris block and try
-        # to detect the filled line. The number of bulding blocks is passed to the class
-        # in the init function.
-        for shape_block in self.active_block.shape:
-            tmp_y = shape_block.y
-            tmp_cnt = self.get_blocks_in_line(tmp_y)
-            # Detect if the line contains the given number of blocks
-            if tmp_cnt != self.blocks_in_line:
-                continue 
-            # Ok, the full line is detected!     
-            self.remove_line(tmp_y)
-            # Update the score.
-            self.score += self.blocks_in_line * constants.POINT_VALUE 
-            # Check if we need to speed up the game. If yes, change control variables
-            if self.score > self.score_level:
-                self.score_level *= constants.SCORE_LEVEL_RATIO
-                self.speed       *= constants.GAME_SPEEDUP_RATIO
-                # Change the game speed
-                self.set_move_timer()
-
-    def remove_line(self,y):
-        """
-        Remove the line with given Y coordinates. Blocks below the filled
-        line are untouched. The rest of blocks (yi > y) are moved one level done.
+    def remove_lines(self,lines):
+        """
+        Remove lines with given Y coordinates.
+
+        Parameters:
+            - lines - Y coordinates of lines in board cells.
+        """
+        engine.Engine.remove_lines(self,lines)
+        # Many locked blocks were moved, draw the whole screen
+        self.full_redraw = True
+        if self.viewport is not None:
+            self.viewport.invalidate(max(lines))
+
+    def restore(self,data):
+        """
+        Restore the game state from the snapshot (see engine.Engine.snapshot). The whole
+        screen is drawn in the next frame.
 
         Parameters:
-            - y - Y coordinate to remove.
-        """ 
-        # Iterate over all blocks in the list and remove blocks with the Y coordinate.
-        for block in self.blk_list:
-            block.remove_blocks(y)
-        # Setup new block list (not needed blocks are removed)
-        self.blk_list = [blk for blk in self.blk_list if blk.has_blocks()]
+            - data - bytes-like object with the snapshot
+        """
+        engine.Engine.restore(self,data)
+        self.full_redraw = True
+        if self.viewport is not None:
+            self.viewport.invalidate(self.board.height)
 
-    def get_blocks_in_line(self,y):
+    def lock_block(self,blk):
         """
-        Get the number of shape blocks on the Y coordinate.
+        Lock the block in the board and in chunks of the large board.
 
         Parameters:
-            - y - Y coordinate to scan.
+            - blk - block to lock
         """
-        # Iteraveovel all block's shape list and increment the counter
-        # if the shape block equals to the Y coordinate.
-        tmp_cnt = 0
-        for block in self.blk_list:
-            for shape_block in block.shape:
-                tmp_cnt += (1 if y == shape_block.y else 0)            
-        return tmp_cnt
+        engine.Engine.lock_block(self,blk)
+        self.locked_blocks.append(blk)
+        if self.viewport is not None:
+            self.viewport.lock(self.get_cells(blk),blk.kind+1)
 
     def draw_board(self):
         """
@@ -315,32 +540,213 @@ class Tetris(object):
         # Update the score         
         self.print_status_line()
 
-    def get_block(self):
+    def draw_locked(self):
         """
-        Generate new block into the game if is required.
+        Draw all locked shape blocks from the board. Tiles of all cells are blitted
+        by one call, empty lines are skipped.
         """
-        if self.new_block:
-            # Get the block and add it into the block list(static for now)
-            tmp = random.randint(0,len(self.block_data)-1)
-            data = self.block_data[tmp]
-            self.active_block = block.Block(data[0],self.start_x,self.start_y,self.screen,data[1],data[2])
-            self.blk_list.append(self.active_block)
-            self.new_block = False
+        cells = self.board.cells
+        width = self.board.width
+        atlas = None
+        areas = []
+        for data in self.block_data:
+            atlas,area = block.get_tile(data[1])
+            areas.append(area)
+        blits = []
+        for y,cnt in enumerate(self.board.line_cnt):
+            if not cnt:
+                continue
+            start = y*width
+            pos_y = self.board_y + y*constants.BHEIGHT
+            for x in range(width):
+                value = cells[start+x]
+                if value:
+                    blits.append((atlas,(self.board_x + x*constants.BWIDTH,pos_y),areas[value-1]))
+        self.screen.blits(blits,doreturn=False)
 
     def draw_game(self):
         """
-        Draw the game screen.
+        Draw the game screen. Only changed parts of the screen are drawn
+        if the dirty drawing is enabled.
         """
+        if self.viewport is not None:
+            self.draw_view()
+            return
+        if self.dirty_draw and not self.full_redraw:
+            self.draw_dirty()
+            return
         # Clean the screen, draw the board and draw
         # all tetris blocks
         self.screen.fill(constants.BLACK)
         self.draw_board()
-        for blk in self.blk_list:
-            blk.draw()
+        self.draw_locked()
+        rects = block.get_rects(self.active_block)
+        ghost = self.get_ghost_rects(rects)
+        self.draw_ghost(ghost)
+        block.draw_rects(self.screen,self.active_block.color,rects)
         # Draw the screen buffer
-        pygame.display.flip()
+        self.update_display()
+        self.remember_drawn(rects + ghost)
+
+    def draw_dirty(self):
+        """
+        Draw changes since the last frame (the moved block, blocks locked since the last
+        frame and the status line) and update only changed areas of the screen.
+        """
+        dirty = []
+        shape = block.get_rects(self.active_block)
+        ghost = self.get_ghost_rects(shape)
+        rects = shape + ghost
+        if self.active_block is not self.drawn_block or rects != self.drawn_rects:
+            # Remove the block and its ghost from the old position. Blocks might be locked
+            # on other positions than the drawn one (with the new block on the screen), so we
+            # draw all locked blocks and the active one.
+            for rect in self.drawn_rects:
+                self.screen.fill(constants.BLACK,rect)
+                # The block can cover the board lines (the block started on narrow board)
+                for brd in (self.board_up,self.board_down,self.board_left,self.board_right):
+                    clip = brd.clip(rect)
+                    if clip.width and clip.height:
+                        self.screen.fill(constants.WHITE,clip)
+            dirty.extend(self.drawn_rects)
+            for blk in self.locked_blocks:
+                locked = block.get_rects(blk)
+                block.draw_rects(self.screen,blk.color,locked)
+                dirty.extend(locked)
+            self.draw_ghost(ghost)
+            block.draw_rects(self.screen,self.active_block.color,shape)
+            dirty.extend(rects)
+        else:
+            rects = self.drawn_rects
+        if self.get_status_line() != self.drawn_status:
+            self.screen.fill(constants.BLACK,self.status_rect)
+            self.print_status_line()
+            dirty.append(self.status_rect)
+        self.update_display(dirty)
+        self.remember_drawn(rects)
+
+    def draw_view(self):
+        """
+        Draw the large board through the viewport. The viewport follows the active block,
+        the area of the viewport is drawn in every frame.
+        """
+        self.viewport.follow(self.get_cells(self.active_block))
+        dirty = [self.view_rect]
+        if self.full_redraw or not self.dirty_draw:
+            self.screen.fill(constants.BLACK)
+            self.draw_board()
+            dirty = None
+        elif self.get_status_line() != self.drawn_status:
+            self.screen.fill(constants.BLACK,self.status_rect)
+            self.print_status_line()
+            dirty.append(self.status_rect)
+        self.viewport.draw(self.screen,self.view_rect,self.active_block,self.board_x,self.board_y,self.get_ghost_rects())
+        self.update_display(dirty)
+        self.remember_drawn()
+
+    def get_ghost_rects(self,rects=None):
+        """
+        Returns Rects of the ghost piece (the active block on its landing position). The
+        list is empty if the block is already on its landing position.
+
+        Parameters:
+            - rects - Rects of the active block (see block.get_rects), they are created
+                      if they are not given
+        """
+        blk = self.active_block
+        dist = self.get_drop_distance(blk,blk.x,blk.y,blk.rotation)
+        if not dist:
+            return []
+        if rects is None:
+            rects = block.get_rects(blk)
+        return [bl.move(0,dist*constants.BHEIGHT) for bl in rects]
+
+    def draw_ghost(self,rects):
+        """
+        Draw the ghost piece (borders of shape blocks in the color of the active block).
+
+        Parameters:
+            - rects - Rects of the ghost piece (see get_ghost_rects)
+        """
+        for rect in rects:
+            pygame.draw.rect(self.screen,self.active_block.color,rect,constants.GHOST_WIDTH)
+
+    def update_display(self,dirty=None):
+        """
+        Show the drawn frame on the screen. The profiler overlay is drawn before and
+        the input latency of the frame is measured after the update.
+
+        Parameters:
+            - dirty - list of changed Rects (None means the whole screen)
+        """
+        if self.profiler is not None:
+            rect = self.draw_profile(dirty is None)
+            if rect is not None and dirty is not None:
+                dirty.append(rect)
+        if dirty is None:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+        if self.input_time is not None:
+            self.profiler.add_latency(time.perf_counter_ns() - self.input_time)
+            self.input_time = None
+
+    def draw_profile(self,force):
+        """
+        Draw measured times below the board (the frame time, its median and the 99th
+        percentile and the number of locked cells). The text is updated every PROFILE_PERIOD
+        frames. Returns the Rect of the overlay or None if nothing was drawn.
+
+        Parameters:
+            - force - draw the overlay even if the text was not changed
+        """
+        prof = self.profiler
+        if prof.frames % constants.PROFILE_PERIOD == 0:
+            frame = prof.get_summary()["frame"]
+            self.profile_text = "FRAME {0:.2f}  P50 {1:.2f}  P99 {2:.2f} ms  CELLS {3}".format(
+                frame["mean"],frame["p50"],frame["p99"],sum(self.board.line_cnt))
+        elif not force:
+            return None
+        self.screen.fill(constants.BLACK,self.profile_rect)
+        # The text is changed often, it is not stored in the text cache
+        txt_surf = self.profile_font.render(self.profile_text,True,constants.WHITE)
+        self.screen.blit(txt_surf,(constants.POINT_MARGIN,self.profile_rect.y+constants.BOARD_MARGIN))
+        return self.profile_rect
+
+    def remember_drawn(self,rects=None):
+        """
+        Remember the state of the drawn frame.
+
+        Parameters:
+            - rects - Rects of the drawn block and its ghost (they are created if they
+                      are not given)
+        """
+        self.full_redraw = False
+        self.drawn_block = self.active_block
+        self.locked_blocks = []
+        if rects is None:
+            shape = block.get_rects(self.active_block)
+            rects = shape + self.get_ghost_rects(shape)
+        self.drawn_rects = rects
+        self.drawn_status = self.get_status_line()
 
 if __name__ == "__main__":
-    Tetris(16,30).run()
+    parser = argparse.ArgumentParser(description="Tetris game.")
+    parser.add_argument("--seed",type=int,default=None,help="seed of the block generator")
+    parser.add_argument("--record",default=None,metavar="FILE",help="write the game log (see replay.py)")
+    parser.add_argument("--auto",action="store_true",help="the game is played by the automatic player")
+    parser.add_argument("--profile",action="store_true",help="measure times of game phases and show them below the board")
+    parser.add_argument("--trace",default=None,metavar="FILE",help="write measured times to the CSV (*.csv) or JSON file")
+    parser.add_argument("--startup",action="store_true",help="print times of the program start and quit after the first frame")
+    parser.add_argument("--size",default="16x30",metavar="WxH",help="number of blocks in x and y")
+    parser.add_argument("--turbo",type=float,default=1.0,help="speed of the game time (e.g., 10 runs the game 10 times faster)")
+    parser.add_argument("--view",default=None,metavar="WxH",help="large board mode - size of the viewport in cells (the board has exactly WxH cells of --size)")
+    args = parser.parse_args()
+    if not (args.turbo > 0 and math.isfinite(args.turbo)):
+        parser.error("--turbo has to be a positive finite number")
+    bx,by = [int(v) for v in args.size.split("x")]
+    view = tuple([int(v) for v in args.view.split("x")]) if args.view else None
+    Tetris(bx,by,seed=args.seed,record=args.record,auto=args.auto,profile=args.profile,trace=args.trace,view=view,
+           startup=args.startup,turbo=args.turbo).run()
 
 #Special add to try pull requests
\ No newline at end of file
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# File: textcache.py
+# Description: Cache of rendered text surfaces.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+
+class TextCache(object):
+    """
+    Cache of rendered text surfaces. Surfaces are identified by the font, the
+    string and the color. The least recently used surface is removed when the
+    cache is full.
+    """
+
+    def __init__(self,max_size):
+        """
+        Initialize the cache.
+
+        Parameters:
+            - max_size - maximal number of cached surfaces
+        """
+        self.max_size = max_size
+        self.surfaces = collections.OrderedDict()
+
+    def render(self,font,string,color):
+        """
+        Returns the surface with the rendered string. The string is rendered only
+        if it is not in the cache.
+
+        Parameters:
+            - font - pygame font object
+            - string - string to render
+            - color - color of the text in RGB notation
+        """
+        key = (font,string,color)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            # Mark the surface as the most recently used
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = font.render(string,False,color)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surf
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# File: timerwheel.py
+# Description: Timer wheel for many timers with the same resolution.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+class TimerWheel(object):
+    """
+    The hashed timer wheel. Time is divided into ticks of the given resolution
+    and each tick has its slot (slot = tick % size). Adding and removing of the
+    timer is O(1) and the advance function visits only slots of passed ticks,
+    so one wheel can drive thousands of timers. Timers which are longer than
+    the wheel stay in their slot till their tick comes.
+
+    Timers never expire before their time, they can expire up to one resolution later.
+    """
+
+    def __init__(self,resolution,size,now=0):
+        """
+        Initialize the wheel.
+
+        Parameters:
+            - resolution - length of one tick (in units of the time, e.g. ms)
+            - size - number of slots
+            - now - current time
+        """
+        self.resolution = resolution
+        self.size = size
+        self.slots = [[] for i in range(size)]
+        # The first tick which was not processed
+        self.tick = int(now // resolution) + 1
+        # Number of active timers
+        self.count = 0
+
+    def schedule(self,item,when):
+        """
+        Add the timer and return its handle (see cancel).
+
+        Parameters:
+            - item - object returned by the advance function
+            - when - time of the timer expiration
+        """
+        # Round up, the timer cannot expire before its time
+        tick = max(self.tick,-int(-when // self.resolution))
+        entry = [tick,item]
+        self.slots[tick % self.size].append(entry)
+        self.count += 1
+        return entry
+
+    def cancel(self,entry):
+        """
+        Remove the timer. The entry is removed from its slot when the slot is visited.
+
+        Parameters:
+            - entry - the handle returned by schedule
+        """
+        if entry[1] is not None:
+            entry[1] = None
+            self.count -= 1
+
+    def advance(self,now):
+        """
+        Move the wheel to the given time and return the list of expired items.
+
+        Parameters:
+            - now - current time
+        """
+        res = []
+        last = int(now // self.resolution)
+        # All slots are visited once per round, the wheel doesn't need more iterations
+        if last - self.tick >= self.size:
+            self.tick = last - self.size + 1
+        while self.tick <= last:
+            idx = self.tick % self.size
+            keep = []
+            for entry in self.slots[idx]:
+                if entry[1] is None:
+                    continue
+                if entry[0] <= last:
+                    res.append(entry[1])
+                    entry[1] = None
+                    self.count -= 1
+                else:
+                    keep.append(entry)
+            self.slots[idx] = keep
+            self.tick += 1
+        return res
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# File: tournament.py
+# Description: Run many seeded headless games in a process pool.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import functools
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import ai
+import engine
+
+# Time between two actions of the player (ms of the game time)
+INPUT_TICK = 100
+# Number of the best placements from which the random policy selects
+RANDOM_PLACEMENTS = 3
+
+def random_policy():
+    """
+    Returns the policy which drops each block on the random placement selected from
+    RANDOM_PLACEMENTS best placements by the board evaluation of the automatic player
+    (without the next block, see ai.AutoPlayer.start_search). Uniformly random actions
+    or placements almost never fill a line, so the baseline wouldn't score.
+    """
+    player = ai.AutoPlayer(lookahead=False)
+    # The block we have planned for and remaining actions
+    state = {"block" : None, "plan" : []}
+
+    def select(eng,rnd):
+        if eng.active_block is not state["block"]:
+            state["block"] = eng.active_block
+            placements = player.start_search(eng).placements
+            order = sorted(range(len(placements)),key=lambda i: (-placements[i][0],i))
+            plan = []
+            if order:
+                plan = list(placements[rnd.choice(order[:RANDOM_PLACEMENTS])][3])
+            state["plan"] = plan + [engine.ACTION_DROP]
+        if state["plan"]:
+            return state["plan"].pop(0)
+        return engine.ACTION_DOWN
+
+    return select
+
+def ai_policy():
+    """
+    Returns the policy of the automatic player (see ai.py).
+    """
+    player = ai.AutoPlayer()
+    return lambda eng,rnd: player.get_action(eng)
+
+# Available policies (name -> function called for each game, which returns the function(eng,rnd)
+# returning the action)
+POLICIES = {
+    "random" : random_policy,
+    "ai"     : ai_policy,
+}
+
+def play_game(seed,width,height,policy,max_steps):
+    """
+    Play one game and return the dictionary with its result. The game is fully given
+    by its parameters, so it can be replayed from the seed.
+
+    The player selects the action every INPUT_TICK ms of the game time and the
+    gravity moves the block down every get_move_tick() ms (like the timer in the
+    drawn game).
+
+    Parameters:
+        - seed - seed of the block generator and of the policy
+        - width - number of cells in one line
+        - height - number of lines
+        - policy - name of the policy from POLICIES
+        - max_steps - maximal number of player actions (0 means no limit)
+    """
+    eng = engine.Engine(width,height,seed=seed)
+    eng.reset()
+    rnd = random.Random(seed)
+    select = POLICIES[policy]()
+    game_time = 0
+    next_move = eng.get_move_tick()
+    steps = 0
+    while not eng.game_over and (max_steps == 0 or steps < max_steps):
+        eng.step(select(eng,rnd))
+        steps += 1
+        game_time += INPUT_TICK
+        # Apply all gravity moves which happened till now
+        while game_time >= next_move and not eng.game_over:
+            eng.step(engine.ACTION_DOWN)
+            next_move += eng.get_move_tick()
+    return {
+        "seed"      : seed,
+        "policy"    : policy,
+        "score"     : eng.score,
+        "lines"     : eng.lines,
+        "pieces"    : eng.pieces,
+        "speed"     : eng.speed,
+        "steps"     : steps,
+        "game_over" : eng.game_over,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many seeded tetris games without the display.")
+    parser.add_argument("--games",type=int,default=1000,help="number of games")
+    parser.add_argument("--seed",type=int,default=0,help="seed of the first game, the game i uses seed+i")
+    parser.add_argument("--workers",type=int,default=None,help="number of processes (default is the number of CPUs)")
+    parser.add_argument("--width",type=int,default=16,help="number of cells in one line")
+    parser.add_argument("--height",type=int,default=28,help="number of lines")
+    parser.add_argument("--policy",default="random",choices=sorted(POLICIES),help="policy of the player")
+    parser.add_argument("--max-steps",type=int,default=0,help="maximal number of player actions in one game (0 means no limit)")
+    parser.add_argument("--output",default="results.jsonl",help="file with results (one JSON line per game)")
+    parser.add_argument("--replay",type=int,default=None,metavar="SEED",help="replay one game with the given seed and print its result")
+    args = parser.parse_args()
+
+    play = functools.partial(play_game,width=args.width,height=args.height,policy=args.policy,max_steps=args.max_steps)
+    if args.replay is not None:
+        print(json.dumps(play(args.replay)))
+        return
+
+    # Results are written in the order of finished games
+    start = time.perf_counter()
+    total_score = 0
+    seeds = range(args.seed,args.seed+args.games)
+    chunk = max(1,args.games // (64*(args.workers or multiprocessing.cpu_count())))
+    with open(args.output,"w") as out, multiprocessing.Pool(args.workers) as pool:
+        for res in pool.imap_unordered(play,seeds,chunksize=chunk):
+            out.write(json.dumps(res) + "\n")
+            out.flush()
+            total_score += res["score"]
+    elapsed = time.perf_counter() - start
+    sys.stderr.write("{0} games in {1:.2f} s ({2:.0f} games/sec), mean score {3:.1f}\n".format(
+        args.games,elapsed,args.games/elapsed,total_score/max(1,args.games)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+# File: viewport.py
+# Description: Drawing of large boards through the viewport with pre-drawn chunks.
+# Author: Pavel Benáček <pavel.benacek@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+
+import pygame
+
+import block
+import constants
+
+class Viewport(object):
+    """
+    The class which draws the part of the large board around the active block. Locked
+    blocks are drawn into chunk surfaces (square areas of CHUNK_SIZE x CHUNK_SIZE cells),
+    so the frame only blits chunks inside the viewport and the time of the frame doesn't
+    depend on the board size. Chunks are drawn when they become visible, the locked block
+    is drawn into existing chunks and chunks are redrawn only after the line removal.
+
+    At most CHUNK_CACHE chunks are kept, the least recently drawn chunk is removed first.
+    Empty chunks have no surface.
+    """
+
+    def __init__(self,brd,colors,width,height):
+        """
+        Initialize the viewport.
+
+        Parameters:
+            - brd - the board.Board object
+            - colors - list of colors of block types (the board cell keeps the type + 1)
+            - width,height - size of the viewport in cells (it is limited by the board size)
+        """
+        self.board = brd
+        self.colors = colors
+        self.width = min(width,brd.width)
+        self.height = min(height,brd.height)
+        # The upper left cell of the viewport
+        self.x = 0
+        self.y = 0
+        # Drawn chunks - (X,Y) index of the chunk -> Surface or None for the empty chunk
+        self.chunks = collections.OrderedDict()
+
+    def follow(self,cells):
+        """
+        Scroll the viewport to keep cells (the active block) at least VIEW_MARGIN cells
+        from the viewport border. The viewport doesn't leave the board.
+
+        Parameters:
+            - cells - list of (X,Y) cells
+        """
+        margin_x = min(constants.VIEW_MARGIN,(self.width-1)//2)
+        margin_y = min(constants.VIEW_MARGIN,(self.height-1)//2)
+        min_x = min([x for x,y in cells])
+        max_x = max([x for x,y in cells])
+        min_y = min([y for x,y in cells])
+        max_y = max([y for x,y in cells])
+        if min_x - margin_x < self.x:
+            self.x = min_x - margin_x
+        if max_x + margin_x >= self.x + self.width:
+            self.x = max_x + margin_x - self.width + 1
+        if min_y - margin_y < self.y:
+            self.y = min_y - margin_y
+        if max_y + margin_y >= self.y + self.height:
+            self.y = max_y + margin_y - self.height + 1
+        self.x = max(0,min(self.x,self.board.width - self.width))
+        self.y = max(0,min(self.y,self.board.height - self.height))
+
+    def draw_chunk(self,cx,cy):
+        """
+        Draw locked blocks of the chunk. Returns the new Surface or None if the chunk is empty.
+
+        Parameters:
+            - cx,cy - index of the chunk
+        """
+        size = constants.CHUNK_SIZE
+        brd = self.board
+        atlas = None
+        areas = []
+        for color in self.colors:
+            atlas,area = block.get_tile(color)
+            areas.append(area)
+        blits = []
+        for y in range(cy*size,min((cy+1)*size,brd.height)):
+            if not brd.line_cnt[y]:
+                continue
+            line = brd.cells[y*brd.width+cx*size:y*brd.width+min((cx+1)*size,brd.width)]
+            pos_y = (y - cy*size)*constants.BHEIGHT
+            for x,value in enumerate(line):
+                if value:
+                    blits.append((atlas,(x*constants.BWIDTH,pos_y),areas[value-1]))
+        if not blits:
+            return None
+        surf = pygame.Surface((size*constants.BWIDTH,size*constants.BHEIGHT))
+        surf.blits(blits,doreturn=False)
+        return surf
+
+    def get_chunk(self,cx,cy):
+        """
+        Returns the Surface of the chunk (None for the empty chunk). The chunk is drawn
+        if it is not stored.
+
+        Parameters:
+            - cx,cy - index of the chunk
+        """
+        key = (cx,cy)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+        surf = self.draw_chunk(cx,cy)
+        self.chunks[key] = surf
+        if len(self.chunks) > constants.CHUNK_CACHE:
+            self.chunks.popitem(last=False)
+        return surf
+
+    def lock(self,cells,value):
+        """
+        Draw locked cells into stored chunks (other chunks are drawn from the board
+        when they are needed).
+
+        Parameters:
+            - cells - list of (X,Y) locked cells
+            - value - value of cells in the board (block type + 1)
+        """
+        size = constants.CHUNK_SIZE
+        rect = pygame.Rect(0,0,constants.BWIDTH,constants.BHEIGHT)
+        for x,y in cells:
+            key = (x//size,y//size)
+            if not self.board.is_inside(x,y) or key not in self.chunks:
+                continue
+            surf = self.chunks[key]
+            if surf is None:
+                surf = pygame.Surface((size*constants.BWIDTH,size*constants.BHEIGHT))
+                self.chunks[key] = surf
+            rect.x = (x % size)*constants.BWIDTH
+            rect.y = (y % size)*constants.BHEIGHT
+            block.draw_shape_block(surf,self.colors[value-1],rect)
+
+    def invalidate(self,line):
+        """
+        Remove chunks which contain lines up to the given line (they were moved
+        by the line removal).
+
+        Parameters:
+            - line - the lowest changed line
+        """
+        last = line // constants.CHUNK_SIZE
+        for key in [key for key in self.chunks if key[1] <= last]:
+            del self.chunks[key]
+
+    def draw(self,screen,rect,blk,board_x,board_y,ghost=()):
+        """
+        Draw visible chunks, the ghost piece and the active block into the rect of the screen.
+
+        Parameters:
+            - screen - screen to draw on
+            - rect - Rect of the viewport on the screen
+            - blk - the active block (its position is in pixels from board_x,board_y)
+            - board_x,board_y - position of the first board cell used by the block
+            - ghost - Rects of the ghost piece (in the same coordinates as the block)
+        """
+        size = constants.CHUNK_SIZE
+        chunk_w = size*constants.BWIDTH
+        chunk_h = size*constants.BHEIGHT
+        # Screen position of the board origin
+        org_x = rect.x - self.x*constants.BWIDTH
+        org_y = rect.y - self.y*constants.BHEIGHT
+        screen.fill(constants.BLACK,rect)
+        clip = screen.get_clip()
+        screen.set_clip(rect)
+        for cy in range(self.y//size,(self.y+self.height-1)//size+1):
+            for cx in range(self.x//size,(self.x+self.width-1)//size+1):
+                surf = self.get_chunk(cx,cy)
+                if surf is not None:
+                    screen.blit(surf,(org_x+cx*chunk_w,org_y+cy*chunk_h))
+        for bl in ghost:
+            pygame.draw.rect(screen,blk.color,bl.move(org_x-board_x,org_y-board_y),constants.GHOST_WIDTH)
+        block.draw_rects(screen,blk.color,block.get_rects(blk,org_x-board_x,org_y-board_y))
+        screen.set_clip(clip)